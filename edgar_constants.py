@@ -0,0 +1,12 @@
+__version__ = ".01"
+__author__ = "gazzman"
+__copyright__ = "(C) gazzman GNU GPL 3."
+__contributors__ = []
+
+# shared by the retreiver, which saves filings, and the readers, which
+# fetch any schemas missing from IMPORTED_SCHEMA_DIR
+UASTRING=('Mozilla/5.0 (X11; Linux x86_64; rv:10.0.5) Gecko/20120606'
+            + 'Firefox/10.0.5')
+HEADER = {'User-Agent' : UASTRING}
+SERVER = 'http://sec.gov'
+IMPORTED_SCHEMA_DIR = 'imported_schemas'
@@ -0,0 +1,322 @@
+#!/usr/bin/python
+__version__ = ".01"
+__author__ = "gazzman"
+__copyright__ = "(C) gazzman GNU GPL 3."
+__contributors__ = []
+
+from multiprocessing.pool import ThreadPool
+import hashlib
+import httplib
+import os
+import shutil
+import socket
+import sqlite3
+import sys
+import tempfile
+import threading
+import time
+import urlparse
+
+from sec import instrumentation as instr
+
+RATE = 10 # EDGAR allows at most 10 requests per second
+WORKERS = 4
+RETRIES = 3
+BACKOFF = 1.
+TIMEOUT = 30
+MAX_REDIRECTS = 5
+RETRY_STATUSES = [429, 500, 502, 503, 504]
+REDIRECT_STATUSES = [301, 302, 303, 307, 308]
+MIRROR_DIR = 'mirror'
+MIRROR_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS urls (
+    url TEXT PRIMARY KEY,
+    sha1 TEXT NOT NULL,
+    etag TEXT,
+    last_modified TEXT,
+    fetched TEXT NOT NULL
+);
+'''
+
+
+class DownloadError(Exception):
+    pass
+
+
+class RetryableError(Exception):
+    pass
+
+
+class RateLimiter:
+    """RateLimiter: Spaces out calls across every thread sharing it
+
+    A RateLimiter is initialized with the maximum number of calls
+    to wait() that may return per second. A rate of None or 0 does
+    not limit.
+
+    """
+
+    def __init__(self, rate=RATE):
+        if rate: self.interval = 1. / rate
+        else: self.interval = 0
+        self.lock = threading.Lock()
+        self.next_time = 0
+
+    def wait(self):
+        with self.lock:
+            now = time.time()
+            delay = self.next_time - now
+            self.next_time = max(now, self.next_time) + self.interval
+        if delay > 0: time.sleep(delay)
+
+
+def write_atomic(path, data):
+    ''' Writes data to a temporary file beside path, then renames it
+        into place so that readers never see a partial file
+    '''
+    dirname, fname = os.path.split(path)
+    fd, tmp_path = tempfile.mkstemp(prefix='.%s.' % fname, dir=dirname or '.')
+    try:
+        with os.fdopen(fd, 'wb') as f:
+            f.write(data)
+        os.rename(tmp_path, path)
+    except:
+        os.remove(tmp_path)
+        raise
+
+
+class Mirror:
+    """Mirror: A content-addressed local store of downloaded files
+
+    Every body saved through a Downloader with a Mirror is stored once
+    under objects/ in the mirror directory, named by its sha1, however
+    many urls or paths it is saved under. The url's sha1, ETag and
+    Last-Modified headers are kept in mirror.db so it can be
+    revalidated with a conditional request. Files are materialized at
+    their paths as hard links to the stored body, or copies where the
+    filesystem does not allow links.
+
+    """
+
+    def __init__(self, dirname=MIRROR_DIR):
+        self.dirname = dirname
+        if not os.path.exists(os.path.join(dirname, 'objects')):
+            os.makedirs(os.path.join(dirname, 'objects'))
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(os.path.join(dirname, 'mirror.db'), check_same_thread=False)
+        self.conn.text_factory = str
+        self.conn.executescript(MIRROR_SCHEMA)
+
+    def blob_path(self, sha1):
+        return os.path.join(self.dirname, 'objects', sha1[:2], sha1[2:])
+
+    def lookup(self, url):
+        ''' Returns the (sha1, etag, last_modified) stored for url, or
+            None if it is not stored or its body has gone missing
+        '''
+        with self.lock:
+            entry = self.conn.execute('SELECT sha1, etag, last_modified FROM urls WHERE url = ?',
+                                      (url,)).fetchone()
+        if entry is None or not os.path.exists(self.blob_path(entry[0])): return None
+        return entry
+
+    def store(self, url, body, etag=None, last_modified=None):
+        ''' Stores body for url, returning its sha1
+        '''
+        sha1 = hashlib.sha1(body).hexdigest()
+        blob_path = self.blob_path(sha1)
+        if not os.path.exists(blob_path):
+            if not os.path.exists(os.path.dirname(blob_path)): 
+                try: os.makedirs(os.path.dirname(blob_path))
+                except OSError: pass # made by another thread
+            write_atomic(blob_path, body)
+        else:
+            instr.count('mirror.deduplicated')
+        with self.lock, self.conn:
+            self.conn.execute('INSERT OR REPLACE INTO urls VALUES (?, ?, ?, ?, ?)',
+                              (url, sha1, etag, last_modified, 
+                               time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime())))
+        return sha1
+
+    def touch(self, url):
+        with self.lock, self.conn:
+            self.conn.execute('UPDATE urls SET fetched = ? WHERE url = ?',
+                              (time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime()), url))
+
+    def read(self, sha1):
+        with open(self.blob_path(sha1), 'rb') as f:
+            return f.read()
+
+    def materialize(self, sha1, path):
+        ''' Puts the body for sha1 at path, returning False if path
+            already was that body
+        '''
+        blob_path = self.blob_path(sha1)
+        if os.path.exists(path) and os.path.samefile(path, blob_path): return False
+        dirname, fname = os.path.split(path)
+        fd, tmp_path = tempfile.mkstemp(prefix='.%s.' % fname, dir=dirname or '.')
+        os.close(fd)
+        try:
+            try:
+                os.remove(tmp_path)
+                os.link(blob_path, tmp_path)
+            except (OSError, AttributeError): # no hard links here
+                shutil.copyfile(blob_path, tmp_path)
+            os.rename(tmp_path, path)
+        except:
+            if os.path.exists(tmp_path): os.remove(tmp_path)
+            raise
+        return True
+
+
+class Downloader:
+    """Downloader: Fetches urls concurrently under a shared rate limit
+
+    Each worker thread keeps one persistent connection per host.
+    Requests that fail with a connection error or a retryable
+    status are retried with exponential backoff.
+
+    Keyword arguments:
+    headers -- HTTP headers to send with every request
+    rate -- maximum requests per second across all workers
+    workers -- number of concurrent worker threads
+    retries -- number of retries before giving up on a url
+    backoff -- seconds to wait before the first retry, doubled after each
+    limiter -- a RateLimiter to share with other Downloaders
+    mirror -- a Mirror through which saved files are revalidated and stored
+
+    """
+
+    def __init__(self, headers=None, rate=RATE, workers=WORKERS, retries=RETRIES,
+                 backoff=BACKOFF, timeout=TIMEOUT, limiter=None, mirror=None):
+        self.headers = headers or {}
+        self.workers = workers
+        self.retries = retries
+        self.backoff = backoff
+        self.timeout = timeout
+        self.limiter = limiter or RateLimiter(rate)
+        self.mirror = mirror
+        self.local = threading.local()
+
+    def connection(self, scheme, netloc):
+        if not hasattr(self.local, 'connections'):
+            self.local.connections = {}
+        key = (scheme, netloc)
+        if key not in self.local.connections:
+            if scheme == 'https': conn_class = httplib.HTTPSConnection
+            else: conn_class = httplib.HTTPConnection
+            self.local.connections[key] = conn_class(netloc, timeout=self.timeout)
+        return self.local.connections[key]
+
+    def drop_connection(self, scheme, netloc):
+        conn = self.local.connections.pop((scheme, netloc), None)
+        if conn is not None: conn.close()
+
+    def request(self, url, headers=None):
+        ''' Makes a single rate limited GET request, following redirects,
+            and returns the response and its body
+        '''
+        for redirect in range(MAX_REDIRECTS + 1):
+            parts = urlparse.urlsplit(url)
+            path = urlparse.urlunsplit(('', '', parts.path or '/', parts.query, ''))
+            request_headers = dict(self.headers)
+            request_headers.update(headers or {})
+            self.limiter.wait()
+            conn = self.connection(parts.scheme, parts.netloc)
+            try:
+                conn.request('GET', path, headers=request_headers)
+                response = conn.getresponse()
+                body = response.read()
+            except (httplib.HTTPException, socket.error) as err:
+                self.drop_connection(parts.scheme, parts.netloc)
+                raise RetryableError('%s: %r' % (url, err))
+            if response.getheader('connection', '').lower() == 'close':
+                self.drop_connection(parts.scheme, parts.netloc)
+            if response.status not in REDIRECT_STATUSES:
+                return response, body
+            url = urlparse.urljoin(url, response.getheader('location'))
+        raise DownloadError('Too many redirects for %s' % url)
+
+    def fetch(self, url, headers=None, ok_statuses=(200,)):
+        ''' Returns the response and body for url, retrying with
+            backoff on connection errors and retryable statuses
+        '''
+        for attempt in range(self.retries + 1):
+            try:
+                with instr.timer('http.fetch'):
+                    response, body = self.request(url, headers)
+                instr.count('http.requests')
+                instr.count('http.bytes', len(body))
+                if response.status in ok_statuses:
+                    return response, body
+                elif response.status in RETRY_STATUSES:
+                    raise RetryableError('%s returned %i' % (url, response.status))
+                else:
+                    raise DownloadError('%s returned %i' % (url, response.status))
+            except RetryableError as err:
+                if attempt == self.retries:
+                    raise DownloadError(str(err))
+                delay = self.backoff * 2 ** attempt
+                instr.count('http.retries')
+                print >> sys.stderr, '%s, retrying in %.1fs' % (err, delay)
+                time.sleep(delay)
+
+    def get(self, url):
+        return self.fetch(url)[1]
+
+    def save(self, url, path):
+        if self.mirror is None:
+            write_atomic(path, self.get(url))
+        else:
+            self.mirror.materialize(self.revalidate(url), path)
+        return path
+
+    def revalidate(self, url):
+        ''' Brings the mirror's copy of url up to date, with a
+            conditional request if it is already stored, and returns
+            its sha1
+        '''
+        entry = self.mirror.lookup(url)
+        headers = {}
+        if entry is not None:
+            sha1, etag, last_modified = entry
+            if etag: headers['If-None-Match'] = etag
+            if last_modified: headers['If-Modified-Since'] = last_modified
+        response, body = self.fetch(url, headers, ok_statuses=(200, 304))
+        if response.status == 304 and entry is not None:
+            instr.count('mirror.not_modified')
+            self.mirror.touch(url)
+            return entry[0]
+        elif response.status == 304:
+            raise DownloadError('%s returned 304 for an unconditional request' % url)
+        return self.mirror.store(url, body, response.getheader('etag'), 
+                                 response.getheader('last-modified'))
+
+    def _map(self, func, items):
+        ''' Applies func to items across the worker threads, yielding
+            (item, result, error) tuples as they complete
+        '''
+        def call(item):
+            try:
+                return item, func(item), None
+            except Exception as err:
+                return item, None, err
+        items = list(items)
+        if len(items) == 0: return
+        pool = ThreadPool(min(self.workers, len(items)))
+        try:
+            for result in pool.imap_unordered(call, items):
+                yield result
+        finally:
+            pool.terminate()
+
+    def get_all(self, urls):
+        ''' Yields (url, body, error) tuples as the urls complete
+        '''
+        return self._map(self.get, urls)
+
+    def save_all(self, jobs):
+        ''' Downloads a list of (url, path) jobs, yielding
+            ((url, path), path, error) tuples as they complete
+        '''
+        return self._map(lambda job: self.save(*job), jobs)
@@ -0,0 +1,181 @@
+#!/usr/bin/python
+__version__ = ".01"
+__author__ = "gazzman"
+__copyright__ = "(C) gazzman GNU GPL 3."
+__contributors__ = []
+
+from collections import namedtuple
+import argparse
+import gzip
+import os
+import re
+import sys
+
+from sec.edgar_downloader import Downloader, Mirror, MIRROR_DIR, RATE
+from sec.filing_catalog import FilingCatalog, accession_number
+from sec.xbrl_retreiver import FilingURLs, HEADER, SERVER, Submission
+
+INDEX_DIR = 'edgar_index'
+FULL_INDEX_URL = SERVER + '/Archives/edgar/full-index/%i/QTR%i/%s'
+DAILY_INDEX_URL = SERVER + '/Archives/edgar/daily-index/%i/QTR%i/%s.%s.idx'
+FORMS = ['10-Q', '10-K', '10-Q/A', '10-K/A']
+
+IndexEntry = namedtuple('IndexEntry', ['cik', 'company', 'form', 'date', 'fname'])
+
+
+def quarter_index_url(quarter, kind='form', compressed=True):
+    ''' Returns the full-index url for a quarter such as 2013Q3
+    '''
+    m = re.match(r'(\d{4})Q([1-4])$', quarter.upper())
+    if not m: raise ValueError('Quarter %s is not of the form YYYYQN' % quarter)
+    fname = '%s.%s' % (kind, 'gz' if compressed else 'idx')
+    return FULL_INDEX_URL % (int(m.group(1)), int(m.group(2)), fname)
+
+
+def daily_index_url(day, kind='form'):
+    ''' Returns the daily-index url for a day such as 20130930
+    '''
+    year, month = int(day[:4]), int(day[4:6])
+    return DAILY_INDEX_URL % (year, (month - 1)/3 + 1, kind, day)
+
+
+def open_index(source, downloader=None):
+    ''' Opens an index file, local or at a url, gzipped or not. Urls
+        are saved under INDEX_DIR through downloader first, so a
+        mirrored downloader only transfers indexes that changed.
+    '''
+    if re.match('https?://', source):
+        path = os.path.join(INDEX_DIR, *source.split('/Archives/edgar/')[-1].split('/'))
+        if not os.path.exists(os.path.dirname(path)): os.makedirs(os.path.dirname(path))
+        downloader = downloader or Downloader(HEADER, mirror=Mirror())
+        source = downloader.save(source, path)
+    if source[-3:] == '.gz': return gzip.open(source, 'rb')
+    return open(source, 'rb')
+
+
+def parse_index(lines):
+    ''' Yields an IndexEntry per line of a form.idx or master.idx
+        file, working out which from its header
+    '''
+    header = None
+    columns = None
+    for line in lines:
+        line = line.rstrip('\r\n')
+        if columns is None:
+            if line.startswith('---'):
+                columns = header
+            elif line.strip():
+                header = line
+            continue
+        if not line.strip(): continue
+        if '|' in columns:
+            cik, company, form, date, fname = line.split('|')
+        else:
+            fname, date, cik = line.rsplit(None, 3)[-3:][::-1]
+            company_start = columns.index('Company Name')
+            cik_start = line.rindex(cik, 0, line.rindex(date))
+            form = line[:company_start].strip()
+            company = line[company_start:cik_start].strip()
+        yield IndexEntry(int(cik), company.strip(), form.strip(), date.strip(), fname.strip())
+
+
+def filter_entries(entries, forms=FORMS, ciks=None):
+    ''' Keeps the entries of the given forms, and CIKs if given
+    '''
+    forms = forms and set([ form.upper() for form in forms ])
+    ciks = ciks and set(ciks)
+    for entry in entries:
+        if forms and entry.form.upper() not in forms: continue
+        if ciks and entry.cik not in ciks: continue
+        yield entry
+
+
+def index_submission(entry):
+    ''' Builds the Submission a feed entry for the same filing would
+        give, with the filing date standing in for the acceptance time
+    '''
+    accession = os.path.basename(entry.fname)[:-4]
+    dirname = os.path.dirname(entry.fname)
+    date = entry.date
+    if len(date) == 8: date = '%s-%s-%s' % (date[:4], date[4:6], date[6:]) # daily indexes
+    sub_url = '%s/Archives/%s/%s/%s-index.htm' % (SERVER, dirname, accession.replace('-', ''),
+                                                  accession)
+    title = '%s - %s' % (entry.form, entry.company)
+    return Submission('%sT00:00:00+00:00' % date, title, sub_url, entry.form)
+
+
+def ingest_index(lines, catalog, forms=FORMS, ciks=None):
+    ''' Adds the matching submissions in an index to the catalog,
+        skipping those whose accession number is already stored, and
+        returns a dict of CIK to the number of submissions added
+    '''
+    known = catalog.accessions()
+    added = {}
+    for entry in filter_entries(parse_index(lines), forms, ciks):
+        submission = index_submission(entry)
+        accession = accession_number(submission.sub_url)
+        if accession in known: continue
+        known.add(accession)
+        added.setdefault(entry.cik, []).append(submission)
+    for cik, submissions in added.items():
+        catalog.add_submissions(cik, submissions)
+    return dict([ (cik, len(submissions)) for cik, submissions in added.items() ])
+
+
+if __name__ == '__main__':
+    ''' Command line utility for populating the filing catalog from
+    EDGAR's full or daily form.idx or master.idx files instead of
+    paging through each CIK's atom feed
+
+    Submissions added this way are dated by filing date, not
+    acceptance time. The catalog keys submissions by accession number,
+    so a filing already added from a feed or another index is not
+    added again, and keeps the date its files were saved under.
+    '''
+    description = 'Populate the filing catalog from EDGAR full or daily indexes.'
+
+    p = argparse.ArgumentParser(description=description)
+    p.add_argument('sources', nargs='*', help="Index files or urls, optionally gzipped")
+    p.add_argument('--quarter', action='append', default=[],
+                   help="Add the full index for a quarter such as 2013Q3")
+    p.add_argument('--daily', action='append', default=[],
+                   help="Add the daily index for a day such as 20130930")
+    p.add_argument('--kind', choices=['form', 'master'], default='form',
+                   help="Index kind for --quarter and --daily (default: %(default)s)")
+    p.add_argument('--forms', nargs='+', default=FORMS,
+                   help="Form types to keep (default: %(default)s)")
+    p.add_argument('--ciks', nargs='+', type=int, help="Only keep these CIKs")
+    p.add_argument('--ciks-file', help="Only keep the CIKs listed in this file, one per line")
+    p.add_argument('--pull', action="store_true",
+                   help="Pull and save the XBRL filings of every CIK with submissions added")
+    p.add_argument('--archive', action="store_true",
+                   help="With --pull, pack each CIK's filings into a compressed [CIK].zip archive")
+    p.add_argument('--rate', type=float, default=RATE,
+                   help="Maximum requests per second (default: %(default)s)")
+    p.add_argument('--mirror', default=MIRROR_DIR,
+                   help="Directory of the content-addressed mirror (default: %(default)s)")
+    args = p.parse_args()
+
+    ciks = args.ciks
+    if args.ciks_file:
+        ciks = (ciks or []) + [ int(l.strip()) for l in open(args.ciks_file) if l.strip() ]
+    sources = (args.sources + [ quarter_index_url(q, args.kind) for q in args.quarter ]
+               + [ daily_index_url(d, args.kind) for d in args.daily ])
+    downloader = Downloader(HEADER, rate=args.rate, mirror=Mirror(args.mirror))
+    catalog = FilingCatalog()
+    added = {}
+    for source in sources:
+        try:
+            counts = ingest_index(open_index(source, downloader), catalog, args.forms, ciks)
+        except Exception as err:
+            print >> sys.stderr, 'Failed to read %s: %r' % (source, err)
+            continue
+        print >> sys.stderr, '%s: %i submissions added for %i CIKs' % (source, sum(counts.values()),
+                                                                         len(counts))
+        for cik, n in counts.items():
+            added[cik] = added.get(cik, 0) + n
+    if args.pull:
+        for cik in sorted(added):
+            f = FilingURLs(cik, downloader, catalog, archive=args.archive)
+            f.pull_xbrl_urls()
+            f.save_xbrl_filings()
@@ -0,0 +1,140 @@
+#!/usr/bin/python
+__version__ = ".01"
+__author__ = "gazzman"
+__copyright__ = "(C) gazzman GNU GPL 3."
+__contributors__ = []
+
+import argparse
+import bisect
+import csv
+import sys
+
+from sec import xbrl_reader as xr
+from sec import xbrl_tuple_reader as xtr
+
+FACT_KEY = ('cik', 'tag', 'start', 'end', 'segments')
+TUPLE_KEY = ('CIK', 'Segments', 'Period Start', 'Period End')
+HISTORY_HEADERS = ['submission_time', 'value']
+
+
+class Resolver:
+    """Resolver: Resolves duplicated and restated facts across filings
+
+    Rows are added one at a time and keyed by key_fields. Only the
+    latest-submitted row for each key is held, along with a history
+    of the submission times at which its value changed, so a value
+    repeated as a comparative in every later filing costs nothing
+    beyond its first appearance. Memory is bounded by the number of
+    distinct keys, not the number of rows.
+
+    With value_field None, a row's value is every field outside its
+    key and submission time, as for xbrl_tuple_reader rows.
+
+    """
+
+    def __init__(self, key_fields=FACT_KEY, time_field='submission_time', value_field='value'):
+        self.key_fields = key_fields
+        self.time_field = time_field
+        self.value_field = value_field
+        self.latest = {}
+        self.changes = {}
+
+    def key(self, row):
+        return tuple([ row.get(f) or None for f in self.key_fields ])
+
+    def value(self, row):
+        if self.value_field is not None: return row.get(self.value_field)
+        skip = set(self.key_fields + (self.time_field,))
+        return tuple(sorted([ (k, v) for k, v in row.items() if k not in skip ]))
+
+    def add(self, row):
+        key = self.key(row)
+        time = row[self.time_field]
+        value = self.value(row)
+        latest = self.latest.get(key)
+        if latest is None or time >= latest[self.time_field]:
+            self.latest[key] = row
+        changes = self.changes.setdefault(key, [])
+        if len(changes) == 0 or time >= changes[-1][0]:
+            if len(changes) == 0 or value != changes[-1][1]: changes.append((time, value))
+        else:
+            bisect.insort(changes, (time, value))
+            self.changes[key] = [ c for i, c in enumerate(changes)
+                                  if i == 0 or c[1] != changes[i-1][1] ]
+
+    def add_rows(self, rows):
+        for row in rows:
+            self.add(row)
+
+    def history(self, key):
+        ''' Returns the (submission time, value) pairs at which the
+            value for key first appeared or changed, oldest first
+        '''
+        return list(self.changes.get(key, []))
+
+    def restated(self):
+        ''' Returns the keys whose value changed between submissions
+        '''
+        return [ key for key, changes in self.changes.items() if len(changes) > 1 ]
+
+    def resolved(self):
+        ''' Returns the latest-submitted row for every key, ordered by
+            key
+        '''
+        keys = self.latest.keys()
+        keys.sort()
+        return [ self.latest[key] for key in keys ]
+
+
+def read_csv(fnames):
+    ''' Yields the rows of csv files, such as concatenated xbrl_reader.py
+        output, skipping blank lines and repeated headers
+    '''
+    for fname in fnames:
+        f = sys.stdin if fname == '-' else open(fname, 'rb')
+        for row in csv.DictReader(f):
+            if all([ k == v for k, v in row.items() ]): continue
+            yield row
+
+
+def print_history(resolver):
+    headers = list(resolver.key_fields) + HISTORY_HEADERS
+    print ','.join(headers)
+    c = csv.writer(sys.stdout)
+    for key in sorted(resolver.restated()):
+        for time, value in resolver.history(key):
+            if resolver.value_field is None: value = repr(dict(value))
+            c.writerow(list(key) + [time, value])
+
+
+if __name__ == '__main__':
+    ''' Command line utility for resolving the rows printed by
+    xbrl_reader.py, or by xbrl_tuple_reader.py with --tuples, across
+    many filings into the latest-submitted row for each fact
+
+    csv_fnames: The csv files to resolve, or - for STDIN.
+    '''
+    description = 'Resolve duplicated and restated facts to their latest submission.'
+
+    p = argparse.ArgumentParser(description=description)
+    p.add_argument('csv_fnames', nargs='*', default=['-'], help="csv files to resolve")
+    p.add_argument('--tuples', action="store_true", help="Resolve xbrl_tuple_reader.py rows")
+    p.add_argument('--history', action="store_true",
+                   help="Print the history of the restated facts instead")
+    args = p.parse_args()
+
+    if args.tuples: resolver = Resolver(TUPLE_KEY, 'Submission Time', None)
+    else: resolver = Resolver()
+    rows = read_csv(args.csv_fnames)
+    if args.tuples:
+        first = next(rows, None)
+        if first is not None:
+            resolver.add(first)
+            headers = list(xtr.ROWKEY) + [ h for h in sorted(first) if h not in xtr.ROWKEY ]
+    resolver.add_rows(rows)
+    if args.history:
+        print_history(resolver)
+    elif args.tuples:
+        if resolver.latest: xtr.print_data(headers, resolver.resolved())
+    else:
+        xr.print_data(resolver.resolved())
@@ -0,0 +1,197 @@
+#!/usr/bin/python
+__version__ = ".01"
+__author__ = "gazzman"
+__copyright__ = "(C) gazzman GNU GPL 3."
+__contributors__ = []
+
+import argparse
+import csv
+import os
+import sqlite3
+import sys
+
+from sec import filing_metadata as fm
+from sec import xbrl_reader as xr
+
+FACT_STORE_FNAME = 'facts.db'
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS filings (
+    id INTEGER PRIMARY KEY,
+    filing TEXT NOT NULL UNIQUE,
+    cik INTEGER,
+    submission_time TEXT,
+    period_end_date TEXT,
+    fiscal_period TEXT
+);
+CREATE INDEX IF NOT EXISTS filings_cik_period ON filings (cik, period_end_date);
+
+CREATE TABLE IF NOT EXISTS facts (
+    filing_id INTEGER NOT NULL REFERENCES filings (id),
+    cik INTEGER NOT NULL,
+    tag TEXT NOT NULL,
+    period_start TEXT,
+    period_end TEXT,
+    segments TEXT,
+    value TEXT,
+    unit TEXT,
+    decimals TEXT
+);
+CREATE INDEX IF NOT EXISTS facts_lookup ON facts (cik, tag, period_start, period_end, segments);
+'''
+SERIES_HEADERS = ['cik', 'tag', 'fiscal_period', 'period_end_date', 'submission_time',
+                  'start', 'end', 'value', 'unit', 'decimals']
+
+
+class FactStore:
+    """FactStore: A persistent SQLite store of extracted facts
+
+    Facts are ingested a filing at a time from xbrl_reader's
+    extract_data rows and indexed by (cik, tag, period start, period
+    end, segments), so series can be queried across filings without
+    reading any XML again. Filings already ingested are skipped.
+
+    """
+
+    def __init__(self, fname=FACT_STORE_FNAME):
+        self.fname = fname
+        self.conn = sqlite3.connect(fname)
+        self.conn.text_factory = str
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def has_filing(self, filing):
+        return self.conn.execute('SELECT 1 FROM filings WHERE filing = ?',
+                                 (filing,)).fetchone() is not None
+
+    def ingest_rows(self, filing, rows, replace=False):
+        ''' Stores a filing's rows in one transaction, replacing any
+            stored before if replace is True, and returns the number
+            of facts stored
+        '''
+        rows = list(rows)
+        with self.conn:
+            if replace:
+                self.conn.execute('DELETE FROM facts WHERE filing_id IN'
+                                  ' (SELECT id FROM filings WHERE filing = ?)', (filing,))
+                self.conn.execute('DELETE FROM filings WHERE filing = ?', (filing,))
+            cur = self.conn.execute('INSERT INTO filings (filing) VALUES (?)', (filing,))
+            filing_id = cur.lastrowid
+            if len(rows) > 0:
+                r = rows[0]
+                self.conn.execute('UPDATE filings SET cik = ?, submission_time = ?,'
+                                  ' period_end_date = ?, fiscal_period = ? WHERE id = ?',
+                                  (r['cik'], r['submission_time'], r['period_end_date'],
+                                   r.get('fiscal_period'), filing_id))
+            self.conn.executemany('INSERT INTO facts (filing_id, cik, tag, period_start, period_end,'
+                                  ' segments, value, unit, decimals)'
+                                  ' VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                                  [ (filing_id, r['cik'], r['tag'], r['start'], r['end'],
+                                     r['segments'], r['value'], r.get('unit'), r.get('decimals'))
+                                    for r in rows ])
+        return len(rows)
+
+    def ingest(self, base_fname, data_requests, refresh=False):
+        ''' Extracts and stores a filing's facts unless the filing has
+            already been ingested, returning the number of facts stored
+            or None if the filing was skipped
+        '''
+        filing = os.path.basename(base_fname)
+        stored = self.has_filing(filing)
+        if stored and refresh is not True: return None
+        submission = xr.load_submission(base_fname, xr.submission_time(base_fname))
+        rows = list(xr.extract_data(submission, data_requests))
+        return self.ingest_rows(filing, rows, replace=stored)
+
+    def facts(self, cik=None, tag=None, start=None, end=None, segments=None, all_segments=False):
+        ''' Returns matching facts as dicts, oldest submission first.
+            Only unsegmented facts are returned unless segments or
+            all_segments is given.
+        '''
+        clauses = []
+        params = []
+        for column, value in [('f.cik', cik), ('f.tag', tag),
+                              ('f.period_start', start), ('f.period_end', end)]:
+            if value is not None:
+                clauses += ['%s = ?' % column]
+                params += [value]
+        if segments is not None:
+            clauses += ['f.segments = ?']
+            params += [segments]
+        elif not all_segments:
+            clauses += ['f.segments IS NULL']
+        return self.select(clauses, params)
+
+    def series(self, cik, tag, quarterly=False):
+        ''' Returns each filing's value of tag for its own reporting
+            period, oldest first. For an instant tag this is the end of
+            period value, for a duration tag the year to date period
+            ending on the reporting period end date, or the shortest
+            such period, usually the quarter, if quarterly is True.
+        '''
+        clauses = ['f.cik = ?', 'f.tag = ?', 'f.segments IS NULL',
+                   'COALESCE(f.period_end, f.period_start) = g.period_end_date',
+                   ('(f.period_end IS NULL OR f.period_start ='
+                    ' (SELECT %s(d.period_start) FROM facts d WHERE d.filing_id = f.filing_id'
+                    ' AND d.tag = f.tag AND d.segments IS NULL AND d.period_end = f.period_end))'
+                    % ('MAX' if quarterly else 'MIN'))]
+        return self.select(clauses, [cik, tag])
+
+    def select(self, clauses, params):
+        sql = ('SELECT f.cik, f.tag, g.fiscal_period, g.period_end_date, g.submission_time,'
+               ' f.period_start, f.period_end, f.value, f.unit, f.decimals'
+               ' FROM facts f JOIN filings g ON f.filing_id = g.id')
+        if clauses: sql += ' WHERE ' + ' AND '.join(clauses)
+        sql += ' ORDER BY g.period_end_date, g.submission_time'
+        return [ dict(zip(SERIES_HEADERS, row)) for row in self.conn.execute(sql, params) ]
+
+
+def print_facts(facts):
+    print ','.join(SERIES_HEADERS)
+    c = csv.DictWriter(sys.stdout, SERIES_HEADERS)
+    c.writerows(facts)
+
+
+if __name__ == '__main__':
+    description = 'Utility for ingesting facts into and querying the fact store.'
+
+    p = argparse.ArgumentParser(description=description)
+    p.add_argument('--db', default=FACT_STORE_FNAME, help="Fact store filename")
+    sp = p.add_subparsers(dest='command')
+    ip = sp.add_parser('ingest', help="Ingest every filing in a CIK directory")
+    ip.add_argument('cik_dir', help="Directory of filings for a CIK")
+    ip.add_argument('reporting_data_fname', help="File of [NAMESPACE]:[TAG NAME] requests")
+    ip.add_argument('--refresh', action="store_true", help="Re-ingest filings already stored")
+    fm.add_selection_arguments(ip)
+    sp_series = sp.add_parser('series', help="Print a tag's value for each filing's period")
+    sp_series.add_argument('cik', type=int, help="CIK")
+    sp_series.add_argument('tag', help="Tag, e.g. us-gaap:Assets")
+    sp_series.add_argument('--quarterly', action="store_true",
+                           help="Take a duration tag's quarter rather than year to date value")
+    qp = sp.add_parser('query', help="Print matching facts")
+    qp.add_argument('--cik', type=int, help="CIK")
+    qp.add_argument('--tag', help="Tag, e.g. us-gaap:Assets")
+    qp.add_argument('--start', help="Period start, or instant")
+    qp.add_argument('--end', help="Period end")
+    qp.add_argument('--all-segments', action="store_true", help="Include segmented facts")
+    args = p.parse_args()
+
+    store = FactStore(args.db)
+    if args.command == 'ingest':
+        data_requests = xr.listify_commented_file(args.reporting_data_fname)
+        for base_fname in fm.select_filings(args.cik_dir, args):
+            try:
+                count = store.ingest(base_fname, data_requests, args.refresh)
+            except Exception as err:
+                print >> sys.stderr, 'Skipping %s: %r' % (base_fname, err)
+                continue
+            if count is None: 
+                print >> sys.stderr, '%s: already ingested' % os.path.basename(base_fname)
+            else:
+                print >> sys.stderr, '%s: %i facts' % (os.path.basename(base_fname), count)
+    elif args.command == 'series':
+        print_facts(store.series(args.cik, args.tag, args.quarterly))
+    elif args.command == 'query':
+        print_facts(store.facts(args.cik, args.tag, args.start, args.end,
+                                all_segments=args.all_segments))
@@ -0,0 +1,195 @@
+#!/usr/bin/python
+__version__ = ".01"
+__author__ = "gazzman"
+__copyright__ = "(C) gazzman GNU GPL 3."
+__contributors__ = []
+
+import argparse
+import errno
+import os
+import shutil
+import sys
+import tempfile
+import time
+import zipfile
+
+ARCHIVE_EXT = '.zip'
+FILING_EXTS = ('.xml', '.xsd')
+
+# process-wide open archives, keyed by pid so forked workers open their own
+open_archives = {}
+
+
+def archive_fname(dirname):
+    return '%s%s' % (dirname.rstrip('/'), ARCHIVE_EXT)
+
+
+def split_archive(path):
+    ''' Splits a path such as 34088.zip/[BASE FILENAME].xml into the
+        archive and the member within it, or returns None and the path
+        for a file that is not in an archive
+    '''
+    parts = path.replace(os.sep, '/').split('/')
+    for i in range(len(parts) - 1):
+        if parts[i].endswith(ARCHIVE_EXT):
+            archive = '/'.join(parts[:i+1])
+            if os.path.isfile(archive): return archive, '/'.join(parts[i+1:])
+    return None, path
+
+
+def open_archive(archive):
+    ''' Returns an open ZipFile for archive, reopening it if it has
+        changed since it was opened
+    '''
+    key = (os.getpid(), archive)
+    mtime = os.path.getmtime(archive)
+    cached = open_archives.get(key)
+    if cached is None or cached[0] != mtime:
+        if cached is not None: cached[1].close()
+        open_archives[key] = (mtime, zipfile.ZipFile(archive, 'r', allowZip64=True))
+    return open_archives[key][1]
+
+
+def close_archive(archive):
+    cached = open_archives.pop((os.getpid(), archive), None)
+    if cached is not None: cached[1].close()
+
+
+def member_info(path):
+    archive, member = split_archive(path)
+    try:
+        return open_archive(archive).getinfo(member)
+    except KeyError:
+        raise IOError(errno.ENOENT, 'No such file in %s' % archive, path)
+
+
+def open_source(path):
+    ''' Returns something lxml can parse for path: the path itself for
+        a file on disk, or a file object reading the member straight
+        out of its archive
+    '''
+    archive, member = split_archive(path)
+    if archive is None: return path
+    member_info(path)
+    return open_archive(archive).open(member)
+
+
+def exists(path):
+    archive, member = split_archive(path)
+    if archive is None: return os.path.exists(path)
+    return member in open_archive(archive).NameToInfo
+
+
+def getmtime(path):
+    ''' Returns the modification time of a file, or of the file an
+        archive member was packed from
+    '''
+    archive, member = split_archive(path)
+    if archive is None: return os.path.getmtime(path)
+    return time.mktime(member_info(path).date_time + (0, 0, -1))
+
+
+def getsize(path):
+    ''' Returns the size of a file, or the uncompressed size of an
+        archive member
+    '''
+    archive, member = split_archive(path)
+    if archive is None: return os.path.getsize(path)
+    return member_info(path).file_size
+
+
+def members(archive):
+    if not os.path.exists(archive): return []
+    return open_archive(archive).namelist()
+
+
+def sidecar_fname(path):
+    ''' Returns where a file derived from path, such as a pickled
+        index, is kept: beside path, or for an archive member, in the
+        directory named after the archive, which is created if need be
+    '''
+    archive, member = split_archive(path)
+    if archive is None: return path
+    dirname = archive[:-len(ARCHIVE_EXT)]
+    if not os.path.exists(dirname): os.makedirs(dirname)
+    return os.path.join(dirname, member)
+
+
+def pack(archive, fnames, remove=True):
+    ''' Compresses files into archive as members named by their
+        basenames, replacing members of the same names, and removes
+        the files if remove is True
+
+    The archive is never written in place. New members are added to a
+    copy of it, or to a rewrite of it without the members they
+    replace, which is then renamed over it, so an interrupted pack
+    leaves the archive as it was.
+    '''
+    if len(fnames) == 0: return
+    names = set([ os.path.basename(f) for f in fnames ])
+    replacing = os.path.exists(archive) and names & set(members(archive))
+    close_archive(archive)
+    dirname = os.path.dirname(archive) or '.'
+    fd, tmp_path = tempfile.mkstemp(prefix='.%s.' % os.path.basename(archive), dir=dirname)
+    os.close(fd)
+    try:
+        if replacing:
+            old = zipfile.ZipFile(archive, 'r', allowZip64=True)
+            new = zipfile.ZipFile(tmp_path, 'w', zipfile.ZIP_DEFLATED, allowZip64=True)
+            for info in old.infolist():
+                if info.filename not in names: new.writestr(info, old.read(info.filename))
+            old.close()
+        elif os.path.exists(archive):
+            shutil.copyfile(archive, tmp_path)
+            new = zipfile.ZipFile(tmp_path, 'a', zipfile.ZIP_DEFLATED, allowZip64=True)
+        else:
+            new = zipfile.ZipFile(tmp_path, 'w', zipfile.ZIP_DEFLATED, allowZip64=True)
+        for fname in fnames:
+            new.write(fname, os.path.basename(fname))
+        new.close()
+        os.rename(tmp_path, archive)
+    except:
+        os.remove(tmp_path)
+        raise
+    if remove:
+        for fname in fnames:
+            os.remove(fname)
+
+
+def filing_fnames(dirname):
+    ''' Returns the XBRL files saved in a CIK directory, leaving out
+        derived files such as pickled indexes and header tag tuples
+    '''
+    return sorted([ os.path.join(dirname, f) for f in os.listdir(dirname)
+                    if os.path.splitext(f)[1] in FILING_EXTS ])
+
+
+if __name__ == '__main__':
+    ''' Command line utility for packing the XBRL files of a CIK
+    directory into a compressed archive beside it
+
+    The files are removed once packed. Derived files, such as pickled
+    label indexes, stay in the directory, where the readers look for
+    them for filings read from the archive.
+    '''
+    description = 'Pack or list the compressed filing archive of a CIK directory.'
+
+    p = argparse.ArgumentParser(description=description)
+    sp = p.add_subparsers(dest='command')
+    pp = sp.add_parser('pack', help="Pack a CIK directory's XBRL files into [CIK DIR].zip")
+    pp.add_argument('cik_dir', help="Directory of filings for a CIK")
+    pp.add_argument('--keep', action="store_true", help="Keep the files once packed")
+    lp = sp.add_parser('list', help="List the members of an archive")
+    lp.add_argument('archive', help="Archive filename")
+    args = p.parse_args()
+
+    if args.command == 'pack':
+        fnames = filing_fnames(args.cik_dir)
+        before = sum([ os.path.getsize(f) for f in fnames ])
+        pack(archive_fname(args.cik_dir), fnames, remove=not args.keep)
+        print >> sys.stderr, 'Packed %i files, %i bytes, into %s, now %i bytes.' % (
+            len(fnames), before, archive_fname(args.cik_dir),
+            os.path.getsize(archive_fname(args.cik_dir)))
+    elif args.command == 'list':
+        for name in members(args.archive):
+            print name
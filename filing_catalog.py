@@ -0,0 +1,322 @@
+#!/usr/bin/python
+__version__ = ".01"
+__author__ = "gazzman"
+__copyright__ = "(C) gazzman GNU GPL 3."
+__contributors__ = []
+
+from collections import namedtuple
+try: from collections import OrderedDict # >= 2.7
+except ImportError: from ordereddict import OrderedDict # 2.6
+import argparse
+import glob
+import os
+import pickle
+import re
+import sqlite3
+import sys
+
+CATALOG_FNAME = 'edgar.db'
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS symbols (
+    symbol TEXT PRIMARY KEY,
+    cik INTEGER
+);
+CREATE INDEX IF NOT EXISTS symbols_cik ON symbols (cik);
+
+CREATE TABLE IF NOT EXISTS submissions (
+    id INTEGER PRIMARY KEY,
+    cik INTEGER NOT NULL,
+    date TEXT NOT NULL,
+    title TEXT NOT NULL,
+    sub_url TEXT NOT NULL,
+    form TEXT NOT NULL,
+    xbrl_pulled INTEGER NOT NULL DEFAULT 0,
+    accession TEXT,
+    UNIQUE (cik, sub_url, date, title, form)
+);
+CREATE INDEX IF NOT EXISTS submissions_cik_form_date ON submissions (cik, form, date);
+CREATE INDEX IF NOT EXISTS submissions_form_date ON submissions (form, date);
+
+CREATE TABLE IF NOT EXISTS xbrl_files (
+    submission_id INTEGER NOT NULL REFERENCES submissions (id),
+    position INTEGER NOT NULL,
+    url TEXT NOT NULL,
+    PRIMARY KEY (submission_id, position)
+);
+
+CREATE TABLE IF NOT EXISTS syncs (
+    cik INTEGER PRIMARY KEY,
+    last_synced TEXT NOT NULL
+);
+'''
+# a submission is identified by its accession number, whichever feed or index it came
+# from, as feeds link to www.sec.gov and indexes to sec.gov
+ACCESSION_INDEX = 'submissions_accession'
+SUB_URL_INDEX = 'submissions_sub_url' # replaced by ACCESSION_INDEX
+
+Submission = namedtuple('Submission', ['date', 'title', 'sub_url', 'form'])
+
+
+def accession_number(sub_url):
+    ''' Returns the accession number, such as 0000034088-13-000058, in
+        a submission index page url, or the url if it has none
+    '''
+    m = re.search(r'(\d{10}-\d{2}-\d{6})', sub_url)
+    if m is None: return sub_url
+    return m.group(1)
+
+
+class SubmissionUnpickler(pickle.Unpickler):
+    """Unpickles Submissions pickled from any module, including
+    xbrl_retreiver.py run as __main__"""
+
+    def find_class(self, module, name):
+        if name == 'Submission': return Submission
+        return pickle.Unpickler.find_class(self, module, name)
+
+
+def load_pickles(fname):
+    ''' Yields every object pickled one after another in fname,
+        stopping quietly at a record cut short by an interruption
+    '''
+    with open(fname, 'rb') as f:
+        unpickler = SubmissionUnpickler(f)
+        while True:
+            try:
+                yield unpickler.load()
+            except (EOFError, ValueError, pickle.UnpicklingError):
+                break
+
+
+class FilingCatalog:
+    """FilingCatalog: An indexed SQLite catalog of EDGAR filings
+
+    Holds the symbol to CIK map, every submission pulled from a
+    CIK's feed, the XBRL file urls of each submission and the time
+    each CIK's feed was last synced. Every update is written as its
+    own transaction. A submission is stored once per accession
+    number; the first date, title and url stored for it are kept.
+
+    """
+
+    def __init__(self, fname=CATALOG_FNAME):
+        self.fname = fname
+        self.conn = sqlite3.connect(fname)
+        self.conn.text_factory = str
+        self.conn.executescript(SCHEMA)
+        if self.conn.execute('SELECT 1 FROM sqlite_master WHERE name = ?',
+                             (ACCESSION_INDEX,)).fetchone() is None:
+            self.add_accessions()
+            self.dedupe_submissions()
+            with self.conn:
+                self.conn.execute('DROP INDEX IF EXISTS %s' % SUB_URL_INDEX)
+                self.conn.execute('CREATE UNIQUE INDEX %s ON submissions (cik, accession)'
+                                  % ACCESSION_INDEX)
+
+    def close(self):
+        self.conn.close()
+
+    # symbols
+
+    def lookup_cik(self, symbol):
+        ''' Returns the CIK stored for a symbol, None if the symbol is
+            known to have no CIK, and raises KeyError if it is unknown
+        '''
+        row = self.conn.execute('SELECT cik FROM symbols WHERE symbol = ?',
+                                (symbol,)).fetchone()
+        if row is None: raise KeyError(symbol)
+        return row[0]
+
+    def set_cik(self, symbol, cik):
+        self.set_ciks({symbol: cik})
+
+    def set_ciks(self, cik_dict):
+        with self.conn:
+            self.conn.executemany('INSERT OR REPLACE INTO symbols (symbol, cik) VALUES (?, ?)',
+                                  cik_dict.items())
+
+    def cik_dict(self):
+        return dict(self.conn.execute('SELECT symbol, cik FROM symbols'))
+
+    # submissions
+
+    def submission_id(self, cik, submission):
+        row = self.conn.execute('SELECT id FROM submissions WHERE cik = ? AND accession = ?',
+                                (cik, accession_number(submission.sub_url))).fetchone()
+        if row is None: raise KeyError(submission)
+        return row[0]
+
+    def add_accessions(self):
+        ''' Adds the accession column to, and fills it in for, catalogs
+            written before submissions were keyed by accession number
+        '''
+        columns = [ row[1] for row in self.conn.execute('PRAGMA table_info(submissions)') ]
+        with self.conn:
+            if 'accession' not in columns:
+                self.conn.execute('ALTER TABLE submissions ADD COLUMN accession TEXT')
+            self.conn.executemany('UPDATE submissions SET accession = ? WHERE id = ?',
+                                  [ (accession_number(sub_url), submission_id)
+                                    for submission_id, sub_url in
+                                    self.conn.execute('SELECT id, sub_url FROM submissions'
+                                                      ' WHERE accession IS NULL').fetchall() ])
+
+    def dedupe_submissions(self):
+        ''' Removes all but the first stored of each CIK's submissions
+            that share an accession number, as catalogs written before
+            submissions were keyed by it may hold
+        '''
+        with self.conn:
+            dupes = ('SELECT id FROM submissions WHERE id NOT IN'
+                     ' (SELECT MIN(id) FROM submissions GROUP BY cik, accession)')
+            self.conn.execute('DELETE FROM xbrl_files WHERE submission_id IN (%s)' % dupes)
+            self.conn.execute('DELETE FROM submissions WHERE id IN (%s)' % dupes)
+
+    def add_submissions(self, cik, submissions):
+        with self.conn:
+            self.conn.executemany('INSERT OR IGNORE INTO submissions'
+                                  ' (cik, date, title, sub_url, form, accession)'
+                                  ' VALUES (?, ?, ?, ?, ?, ?)',
+                                  [ (cik, s.date, s.title, s.sub_url, s.form,
+                                     accession_number(s.sub_url)) for s in submissions ])
+
+    def set_xbrl_urls(self, cik, submission, urls):
+        ''' Stores the XBRL file urls of a submission, adding the
+            submission if it is not in the catalog yet
+        '''
+        with self.conn:
+            self.conn.execute('INSERT OR IGNORE INTO submissions'
+                              ' (cik, date, title, sub_url, form, accession)'
+                              ' VALUES (?, ?, ?, ?, ?, ?)',
+                              (cik, submission.date, submission.title, submission.sub_url,
+                               submission.form, accession_number(submission.sub_url)))
+            submission_id = self.submission_id(cik, submission)
+            self.conn.execute('DELETE FROM xbrl_files WHERE submission_id = ?', (submission_id,))
+            self.conn.executemany('INSERT INTO xbrl_files (submission_id, position, url)'
+                                  ' VALUES (?, ?, ?)',
+                                  [ (submission_id, i, url) for i, url in enumerate(urls) ])
+            self.conn.execute('UPDATE submissions SET xbrl_pulled = 1 WHERE id = ?',
+                              (submission_id,))
+
+    def submissions(self, cik):
+        ''' Returns an OrderedDict, newest first, mapping each of a
+            CIK's submissions to its list of XBRL file urls, or None
+            if those have not been pulled
+        '''
+        subs = OrderedDict()
+        ids = {}
+        for row in self.conn.execute('SELECT id, date, title, sub_url, form, xbrl_pulled'
+                                     ' FROM submissions WHERE cik = ?'
+                                     ' ORDER BY date DESC, id', (cik,)):
+            s = Submission(*row[1:5])
+            if row[5]: subs[s] = []
+            else: subs[s] = None
+            ids[row[0]] = s
+        for submission_id, url in self.conn.execute('SELECT f.submission_id, f.url'
+                                                    ' FROM xbrl_files f JOIN submissions s'
+                                                    ' ON f.submission_id = s.id WHERE s.cik = ?'
+                                                    ' ORDER BY f.submission_id, f.position', (cik,)):
+            subs[ids[submission_id]] += [url]
+        return subs
+
+    def accessions(self, cik=None):
+        ''' Returns the set of submission accession numbers stored, for
+            one CIK or for all of them
+        '''
+        if cik is None: rows = self.conn.execute('SELECT accession FROM submissions')
+        else: rows = self.conn.execute('SELECT accession FROM submissions WHERE cik = ?', (cik,))
+        return set([ row[0] for row in rows ])
+
+    def query(self, ciks=None, forms=None, after=None, before=None):
+        ''' Returns (cik, Submission) tuples, newest first, filtered by
+            CIK, exact form name and filing date bounds (exclusive)
+        '''
+        clauses = []
+        params = []
+        if ciks is not None:
+            clauses += ['cik IN (%s)' % ', '.join(['?'] * len(ciks))]
+            params += list(ciks)
+        if forms is not None:
+            clauses += ['form IN (%s)' % ', '.join(['?'] * len(forms))]
+            params += list(forms)
+        if after is not None:
+            clauses += ['date > ?']
+            params += [after]
+        if before is not None:
+            clauses += ['date < ?']
+            params += [before]
+        sql = 'SELECT cik, date, title, sub_url, form FROM submissions'
+        if clauses: sql += ' WHERE ' + ' AND '.join(clauses)
+        sql += ' ORDER BY date DESC, cik'
+        return [ (row[0], Submission(*row[1:])) for row in self.conn.execute(sql, params) ]
+
+    # syncs
+
+    def last_synced(self, cik):
+        row = self.conn.execute('SELECT last_synced FROM syncs WHERE cik = ?', (cik,)).fetchone()
+        if row is None: return None
+        return row[0]
+
+    def record_sync(self, cik, timestamp):
+        with self.conn:
+            self.conn.execute('INSERT OR REPLACE INTO syncs (cik, last_synced) VALUES (?, ?)',
+                              (cik, timestamp))
+
+    # one-time import of the pickles written by earlier versions
+
+    def import_cikmap(self, fname='cikmap.pkl'):
+        self.set_ciks(SubmissionUnpickler(open(fname, 'rb')).load())
+
+    def import_submissions(self, cik, fname, checkpoint_fname=None):
+        submissions = SubmissionUnpickler(open(fname, 'rb')).load()
+        if checkpoint_fname is not None and os.path.exists(checkpoint_fname):
+            for ten, urls in load_pickles(checkpoint_fname):
+                submissions[ten] = urls
+        self.add_submissions(cik, submissions)
+        for s, urls in submissions.items():
+            if urls is not None: self.set_xbrl_urls(cik, s, urls)
+
+    def import_sync_times(self, fname='last_synced.pkl'):
+        for cik, timestamp in SubmissionUnpickler(open(fname, 'rb')).load().items():
+            self.record_sync(cik, timestamp)
+
+    def import_pickles(self, dirname='.'):
+        ''' Imports cikmap.pkl, every <cik>_submissions.pkl (and any
+            checkpoint left beside it) and last_synced.pkl in dirname
+        '''
+        cikmap_fname = os.path.join(dirname, 'cikmap.pkl')
+        if os.path.exists(cikmap_fname):
+            self.import_cikmap(cikmap_fname)
+            print >> sys.stderr, 'Imported %s' % cikmap_fname
+        for fname in glob.glob(os.path.join(dirname, '*_submissions.pkl')):
+            m = re.match('(\d+)_submissions.pkl$', os.path.basename(fname))
+            if m:
+                self.import_submissions(int(m.group(1)), fname,
+                                        '%s.ckpt' % fname[:-len('.pkl')])
+                print >> sys.stderr, 'Imported %s' % fname
+        sync_fname = os.path.join(dirname, 'last_synced.pkl')
+        if os.path.exists(sync_fname):
+            self.import_sync_times(sync_fname)
+            print >> sys.stderr, 'Imported %s' % sync_fname
+
+
+if __name__ == '__main__':
+    description = 'Utility for importing into and querying the filing catalog.'
+
+    p = argparse.ArgumentParser(description=description)
+    p.add_argument('--catalog', default=CATALOG_FNAME, help="Catalog filename")
+    sp = p.add_subparsers(dest='command')
+    ip = sp.add_parser('import', help="Import the pickles of earlier versions")
+    ip.add_argument('dirname', nargs='?', default='.', help="Directory holding the pickles")
+    qp = sp.add_parser('query', help="List submissions")
+    qp.add_argument('--cik', type=int, action='append', help="CIK, may be repeated")
+    qp.add_argument('--form', action='append', help="Form name, may be repeated")
+    qp.add_argument('--after', help="Only submissions filed after this date")
+    qp.add_argument('--before', help="Only submissions filed before this date")
+    args = p.parse_args()
+
+    catalog = FilingCatalog(args.catalog)
+    if args.command == 'import':
+        catalog.import_pickles(args.dirname)
+    elif args.command == 'query':
+        for cik, s in catalog.query(args.cik, args.form, args.after, args.before):
+            print '%i\t%s\t%s\t%s' % (cik, s.date, s.form, s.sub_url)
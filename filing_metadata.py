@@ -0,0 +1,282 @@
+#!/usr/bin/python
+__version__ = ".01"
+__author__ = "gazzman"
+__copyright__ = "(C) gazzman GNU GPL 3."
+__contributors__ = []
+
+import argparse
+import csv
+import lxml.etree as etree
+import os
+import sqlite3
+import sys
+
+from sec import filing_archive as fa
+from sec import xbrl_reader as xr
+
+METADATA_FNAME = 'metadata.db'
+DEI_TAGS = xr.DEI_FIELDS + ['DocumentType']
+SCHEMA = '''
+CREATE TABLE IF NOT EXISTS filings (
+    filing TEXT PRIMARY KEY,
+    submission_time TEXT,
+    form TEXT,
+    cik INTEGER,
+    document_type TEXT,
+    period_end_date TEXT,
+    fiscal_year INTEGER,
+    fiscal_period TEXT,
+    size INTEGER
+);
+CREATE INDEX IF NOT EXISTS filings_fiscal ON filings (fiscal_year, fiscal_period);
+
+CREATE TABLE IF NOT EXISTS files (
+    filing TEXT NOT NULL REFERENCES filings (filing),
+    ftype TEXT NOT NULL,
+    size INTEGER,
+    mtime REAL,
+    PRIMARY KEY (filing, ftype)
+);
+'''
+FILING_HEADERS = ['filing', 'submission_time', 'form', 'cik', 'document_type',
+                  'period_end_date', 'fiscal_year', 'fiscal_period', 'size']
+
+
+def metadata_fname(cik_dir):
+    ''' Returns the metadata index filename for a CIK directory or
+        archive, kept in the directory in either case
+    '''
+    return fa.sidecar_fname(os.path.join(cik_dir, METADATA_FNAME))
+
+
+def filing_form(base_fname):
+    ''' Returns the form in a base filename saved by xbrl_retreiver.py,
+        with the '/' of amendments restored
+    '''
+    return '/'.join(os.path.basename(base_fname).split('_')[1:-1])
+
+
+def read_dei(base_fname):
+    ''' Returns the dei values of DEI_TAGS in a filing's instance, None
+        for those it lacks, reading only as far as the last of them or
+        the end of the dei block
+
+    The dei block has ended at the first fact outside it once the cik
+    and period end date have been read.
+    '''
+    dei = {}
+    dei_namespace = None
+    after_dei = False
+    for event, e in etree.iterparse(fa.open_source(xr.ftype_fname(base_fname, 'instance')),
+                                    events=('start', 'end')):
+        if dei_namespace is None:
+            dei_namespace = e.nsmap.get('dei', '')
+            continue
+        if event == 'start': continue
+        qname = etree.QName(e)
+        if qname.namespace == dei_namespace and qname.localname in DEI_TAGS:
+            dei.setdefault(qname.localname, e.text and e.text.strip())
+            if len(dei) == len(DEI_TAGS): break
+        elif 'contextRef' in e.attrib and dei:
+            after_dei = True
+        if after_dei and 'EntityCentralIndexKey' in dei and 'DocumentPeriodEndDate' in dei: break
+        if e.getparent() is not None and e.getparent().getparent() is None: e.clear()
+    return dict([ (tag, dei.get(tag)) for tag in DEI_TAGS ])
+
+
+def filing_files(base_fname):
+    ''' Returns (ftype, size, mtime) for each of a filing's files
+        present on disk or in its archive
+    '''
+    files = []
+    for ftype in xr.FTYPES:
+        fname = xr.ftype_fname(base_fname, ftype)
+        if fa.exists(fname): files += [(ftype, fa.getsize(fname), fa.getmtime(fname))]
+    return files
+
+
+def parse_years(years):
+    ''' Parses a year such as 2012, or a range such as 2010-2013, into
+        a (first, last) tuple
+    '''
+    first, sep, last = years.partition('-')
+    return int(first), int(last or first)
+
+
+class FilingMetadata:
+    """FilingMetadata: An SQLite index of the filings in a CIK directory
+
+    Each filing's form, submission time, dei values and the sizes of
+    its files are recorded once, in [CIK DIR]/metadata.db, so filings
+    can be chosen by fiscal year and period without parsing their
+    instances again. The index is updated incrementally: a filing is
+    only read again when its instance changes.
+
+    """
+
+    def __init__(self, cik_dir):
+        self.cik_dir = cik_dir
+        self.fname = metadata_fname(cik_dir)
+        self.conn = sqlite3.connect(self.fname)
+        self.conn.text_factory = str
+        self.conn.executescript(SCHEMA)
+
+    def close(self):
+        self.conn.close()
+
+    def indexed(self):
+        ''' Returns a dict of filing to the (size, mtime) its instance
+            had when indexed
+        '''
+        return dict([ (filing, (size, mtime)) for filing, size, mtime in
+                      self.conn.execute('SELECT filing, size, mtime FROM files'
+                                        ' WHERE ftype = ?', ('instance',)) ])
+
+    def add(self, base_fname):
+        ''' Reads and records a filing's metadata, replacing any
+            recorded before
+        '''
+        filing = os.path.basename(base_fname)
+        dei = read_dei(base_fname)
+        files = filing_files(base_fname)
+        try: fiscal_year = int(dei.get('DocumentFiscalYearFocus'))
+        except (TypeError, ValueError): fiscal_year = None
+        try: cik = int(dei.get('EntityCentralIndexKey'))
+        except (TypeError, ValueError): cik = None
+        with self.conn:
+            self.conn.execute('DELETE FROM files WHERE filing = ?', (filing,))
+            self.conn.execute('INSERT OR REPLACE INTO filings (filing, submission_time, form, cik,'
+                              ' document_type, period_end_date, fiscal_year, fiscal_period, size)'
+                              ' VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)',
+                              (filing, xr.submission_time(base_fname), filing_form(base_fname),
+                               cik, dei.get('DocumentType'), dei.get('DocumentPeriodEndDate'),
+                               fiscal_year, dei.get('DocumentFiscalPeriodFocus'),
+                               sum([ size for ftype, size, mtime in files ])))
+            self.conn.executemany('INSERT INTO files (filing, ftype, size, mtime)'
+                                  ' VALUES (?, ?, ?, ?)',
+                                  [ (filing,) + f for f in files ])
+
+    def remove(self, filing):
+        with self.conn:
+            self.conn.execute('DELETE FROM files WHERE filing = ?', (filing,))
+            self.conn.execute('DELETE FROM filings WHERE filing = ?', (filing,))
+
+    def update(self, refresh=False):
+        ''' Records the filings added or changed since the last update,
+            or all of them with refresh, forgets those no longer
+            present, and returns the number of filings read
+        '''
+        indexed = self.indexed()
+        base_fnames = xr.list_filings(self.cik_dir)
+        count = 0
+        for base_fname in base_fnames:
+            filing = os.path.basename(base_fname)
+            if refresh is not True and filing in indexed:
+                instance = xr.ftype_fname(base_fname, 'instance')
+                try:
+                    if indexed[filing] == (fa.getsize(instance), fa.getmtime(instance)): continue
+                except (IOError, OSError):
+                    continue
+            try:
+                self.add(base_fname)
+                count += 1
+            except Exception as err:
+                print >> sys.stderr, 'Skipping %s: %r' % (filing, err)
+        present = set([ os.path.basename(b) for b in base_fnames ])
+        for filing in set(indexed) - present:
+            self.remove(filing)
+        return count
+
+    def select(self, forms=None, years=None, periods=None, start=None, end=None):
+        ''' Returns the matching filings as dicts, oldest submission
+            first. years is a (first, last) range of fiscal years,
+            periods a list of fiscal periods such as FY or Q2, and
+            start and end bound the period end date.
+        '''
+        clauses = []
+        params = []
+        if forms:
+            clauses += ['form IN (%s)' % ', '.join(['?'] * len(forms))]
+            params += list(forms)
+        if years:
+            clauses += ['fiscal_year BETWEEN ? AND ?']
+            params += list(years)
+        if periods:
+            clauses += ['fiscal_period IN (%s)' % ', '.join(['?'] * len(periods))]
+            params += [ p.upper() for p in periods ]
+        if start:
+            clauses += ['period_end_date >= ?']
+            params += [start]
+        if end:
+            clauses += ['period_end_date <= ?']
+            params += [end]
+        sql = 'SELECT %s FROM filings' % ', '.join(FILING_HEADERS)
+        if clauses: sql += ' WHERE ' + ' AND '.join(clauses)
+        sql += ' ORDER BY submission_time, filing'
+        return [ dict(zip(FILING_HEADERS, row)) for row in self.conn.execute(sql, params) ]
+
+    def base_fnames(self, **kwargs):
+        ''' Returns the base filenames of the filings select matches
+        '''
+        return [ os.path.join(self.cik_dir, f['filing']) for f in self.select(**kwargs) ]
+
+
+def add_selection_arguments(p):
+    ''' Adds the filing selection options used by select_filings to
+        an ArgumentParser
+    '''
+    p.add_argument('--forms', nargs='+', help="Only read filings of these forms, e.g. 10-K")
+    p.add_argument('--fy', metavar='YEARS', type=parse_years,
+                   help="Only read filings for these fiscal years, e.g. 2012 or 2010-2013")
+    p.add_argument('--period', nargs='+', metavar='PERIOD',
+                   help="Only read filings for these fiscal periods, e.g. FY or Q1 Q2")
+    p.add_argument('--since', help="Only read filings with periods ending on or after this date")
+    p.add_argument('--until', help="Only read filings with periods ending on or before this date")
+
+
+def select_filings(cik_dir, args):
+    ''' Returns the base filenames in a CIK directory or archive that
+        the selection options in args match, updating the metadata
+        index first, or every filing when no option is given
+    '''
+    if not (args.forms or args.fy or args.period or args.since or args.until):
+        return xr.list_filings(cik_dir)
+    metadata = FilingMetadata(cik_dir)
+    metadata.update()
+    base_fnames = metadata.base_fnames(forms=args.forms, years=args.fy, periods=args.period,
+                                       start=args.since, end=args.until)
+    metadata.close()
+    return base_fnames
+
+
+if __name__ == '__main__':
+    ''' Command line utility for updating the metadata index of a CIK
+    directory, or archive, and printing the filings selected from it
+
+    cik_dir: The directory of filings saved by the xbrl_retreiver.py
+             utility, or its archive.
+    '''
+    description = 'Index the metadata of the filings in a CIK directory and select from it.'
+
+    p = argparse.ArgumentParser(description=description)
+    p.add_argument('cik_dir', help="Directory or archive of filings for a CIK")
+    p.add_argument('--refresh', action="store_true", help="Read every filing again")
+    p.add_argument('--files', action="store_true", help="Print the selected filings' files instead")
+    add_selection_arguments(p)
+    args = p.parse_args()
+
+    metadata = FilingMetadata(args.cik_dir)
+    count = metadata.update(args.refresh)
+    print >> sys.stderr, '%i filings read into %s' % (count, metadata.fname)
+    filings = metadata.select(forms=args.forms, years=args.fy, periods=args.period,
+                              start=args.since, end=args.until)
+    if args.files:
+        print ','.join(['filing', 'ftype', 'size', 'mtime'])
+        c = csv.writer(sys.stdout)
+        for f in filings:
+            c.writerows(metadata.conn.execute('SELECT filing, ftype, size, mtime FROM files'
+                                              ' WHERE filing = ? ORDER BY ftype', (f['filing'],)))
+    else:
+        print ','.join(FILING_HEADERS)
+        c = csv.DictWriter(sys.stdout, FILING_HEADERS)
+        c.writerows(filings)
@@ -0,0 +1,228 @@
+#!/usr/bin/python
+__version__ = ".01"
+__author__ = "gazzman"
+__copyright__ = "(C) gazzman GNU GPL 3."
+__contributors__ = []
+
+from contextlib import contextmanager
+import atexit
+import cProfile
+import json
+import os
+import sys
+import threading
+import time
+
+ENV_VAR = 'SEC_STATS' # summary or jsonl
+ENV_FILE = 'SEC_STATS_FILE' # where to write, default STDERR
+ENV_PROFILE = 'SEC_PROFILE' # comma-separated stages to profile
+PROFILE_FMT = '%s.prof'
+
+enabled = False
+output_format = 'summary'
+output_fname = None
+timers = {}
+counters = {}
+profiles = {}
+lock = threading.Lock()
+active_profile = []
+collecting_pid = None
+
+
+def enable(fmt='summary', fname=None, profile=None):
+    ''' Turns instrumentation on. fmt is summary, for a table of the
+        stage timers and counters at exit, or jsonl, for a JSON line
+        per timed stage as it finishes and the counters at exit. Each
+        stage named in profile is run under cProfile and its stats
+        dumped to [STAGE].prof at exit.
+    '''
+    global enabled, output_format, output_fname
+    if fmt not in ('summary', 'jsonl'): raise ValueError('Unknown format %s' % fmt)
+    output_format = fmt
+    output_fname = fname
+    for stage in profile or []:
+        profiles.setdefault(stage, None)
+    if not enabled: atexit.register(report)
+    enabled = True
+
+
+def disable():
+    global enabled
+    enabled = False
+
+
+def reset():
+    timers.clear()
+    counters.clear()
+    profiles.clear()
+
+
+def count(name, n=1):
+    if not enabled: return
+    with lock:
+        counters[name] = counters.get(name, 0) + n
+
+
+def record(stage, seconds):
+    ''' Adds a timing for stage, as measured by the caller
+    '''
+    if not enabled: return
+    with lock:
+        calls, total, longest = timers.get(stage, (0, 0., 0.))
+        timers[stage] = (calls + 1, total + seconds, max(longest, seconds))
+    if output_format == 'jsonl':
+        emit({'stage': stage, 'seconds': seconds, 'time': time.time(), 'pid': os.getpid()})
+
+
+@contextmanager
+def timer(stage):
+    ''' Times the enclosed block as stage, under cProfile if stage is
+        being profiled
+    '''
+    if not enabled:
+        yield
+        return
+    profiler = None
+    if stage in profiles and not active_profile:
+        if profiles[stage] is None: profiles[stage] = cProfile.Profile()
+        profiler = profiles[stage]
+        active_profile.append(stage)
+        profiler.enable()
+    start = time.time()
+    try:
+        yield
+    finally:
+        elapsed = time.time() - start
+        if profiler is not None:
+            profiler.disable()
+            active_profile.pop()
+        record(stage, elapsed)
+
+
+def timed(stage):
+    ''' Decorates a function so each call is timed as stage
+    '''
+    def decorator(func):
+        def wrapper(*args, **kwargs):
+            with timer(stage):
+                return func(*args, **kwargs)
+        wrapper.__name__ = func.__name__
+        wrapper.__doc__ = func.__doc__
+        return wrapper
+    return decorator
+
+
+def collect():
+    ''' Returns and clears the timers and counters recorded so far, or
+        None if instrumentation is off
+    '''
+    if not enabled: return None
+    with lock:
+        collected = (dict(timers), dict(counters))
+        timers.clear()
+        counters.clear()
+    return collected
+
+
+def merge(collected):
+    ''' Adds timers and counters returned by collect in another process
+        to this one's
+    '''
+    if not enabled or collected is None: return
+    stage_timers, stage_counters = collected
+    with lock:
+        for stage, (calls, total, longest) in stage_timers.items():
+            old_calls, old_total, old_longest = timers.get(stage, (0, 0., 0.))
+            timers[stage] = (old_calls + calls, old_total + total, max(old_longest, longest))
+        for name, n in stage_counters.items():
+            counters[name] = counters.get(name, 0) + n
+
+
+class Collecting(object):
+    """Collecting: Wraps a function run in pool worker processes
+
+    Workers are ended without running their exit handlers, so what
+    they record would never be reported. A Collecting function instead
+    returns its result along with the timers and counters recorded
+    while it ran, for merged to add to the parent process's. What a
+    worker inherited from its parent when forked is cleared first.
+
+    """
+
+    def __init__(self, func):
+        self.func = func
+
+    def __call__(self, *args, **kwargs):
+        global collecting_pid
+        if collecting_pid != os.getpid():
+            collecting_pid = os.getpid()
+            collect()
+        result = self.func(*args, **kwargs)
+        return result, collect()
+
+
+def merged(results):
+    ''' Yields the results of a Collecting function, merging the timers
+        and counters returned with each
+    '''
+    for result, collected in results:
+        merge(collected)
+        yield result
+
+
+def emit(event):
+    line = json.dumps(event, sort_keys=True)
+    with lock:
+        if output_fname is None:
+            print >> sys.stderr, line
+        else:
+            with open(output_fname, 'a') as f:
+                f.write(line + '\n')
+
+
+def summary():
+    ''' Returns the stage timers as {stage: (calls, total seconds, max
+        seconds)} and the counters as {name: count}
+    '''
+    with lock:
+        return dict(timers), dict(counters)
+
+
+def print_summary(f=sys.stderr):
+    stage_timers, stage_counters = summary()
+    if stage_timers:
+        print >> f, '%-32s %8s %10s %10s %10s' % ('stage', 'calls', 'total s', 'mean s', 'max s')
+        for stage in sorted(stage_timers):
+            calls, total, longest = stage_timers[stage]
+            print >> f, '%-32s %8i %10.4f %10.4f %10.4f' % (stage, calls, total, total/calls, longest)
+    if stage_counters:
+        print >> f, '%-32s %8s' % ('counter', 'count')
+        for name in sorted(stage_counters):
+            print >> f, '%-32s %8i' % (name, stage_counters[name])
+
+
+def dump_profiles():
+    for stage, profiler in profiles.items():
+        if profiler is not None:
+            profiler.dump_stats(PROFILE_FMT % stage.replace('/', '_'))
+
+
+def report():
+    ''' Writes out the counters, the summary table in summary format,
+        and the profiles; registered to run at exit by enable
+    '''
+    if not enabled: return
+    dump_profiles()
+    if output_format == 'jsonl':
+        stage_timers, stage_counters = summary()
+        emit({'counters': stage_counters, 'time': time.time(), 'pid': os.getpid()})
+    elif output_fname is None:
+        print_summary()
+    else:
+        with open(output_fname, 'a') as f:
+            print_summary(f)
+
+
+if os.environ.get(ENV_VAR):
+    enable(os.environ[ENV_VAR], os.environ.get(ENV_FILE),
+           [ s.strip() for s in os.environ.get(ENV_PROFILE, '').split(',') if s.strip() ])
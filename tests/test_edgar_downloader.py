@@ -0,0 +1,152 @@
+#!/usr/bin/python
+__version__ = ".01"
+__author__ = "gazzman"
+__copyright__ = "(C) gazzman GNU GPL 3."
+__contributors__ = []
+
+from BaseHTTPServer import BaseHTTPRequestHandler, HTTPServer
+from SocketServer import ThreadingMixIn
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+
+from sec.edgar_downloader import DownloadError, Downloader, Mirror, RateLimiter
+
+
+class StandInServer(ThreadingMixIn, HTTPServer):
+    daemon_threads = True
+
+
+class StandInHandler(BaseHTTPRequestHandler):
+    """StandInHandler: A local stand-in for EDGAR
+
+    /ok/[NAME] returns a body naming the path, /flaky/[N]/[NAME] returns
+    503 for the first N requests of that path, /redirect redirects to
+    /ok/redirected, /etag honours If-None-Match and anything else is a
+    404. Every request path is counted in the server's hits.
+
+    """
+
+    protocol_version = 'HTTP/1.1'
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.hits[self.path] = self.server.hits.get(self.path, 0) + 1
+            hits = self.server.hits[self.path]
+        parts = self.path.split('/')
+        if parts[1] == 'ok':
+            self.reply(200, 'body of %s' % self.path)
+        elif parts[1] == 'flaky':
+            if hits <= int(parts[2]): self.reply(503, 'unavailable')
+            else: self.reply(200, 'body of %s' % self.path)
+        elif parts[1] == 'redirect':
+            self.reply(302, '', {'Location': '/ok/redirected'})
+        elif parts[1] == 'etag':
+            if self.headers.getheader('If-None-Match') == '"v1"': self.reply(304, '')
+            else: self.reply(200, 'versioned body', {'ETag': '"v1"'})
+        else:
+            self.reply(404, 'not found')
+
+    def reply(self, status, body, headers=None):
+        self.send_response(status)
+        for k, v in (headers or {}).items():
+            self.send_header(k, v)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args):
+        pass
+
+
+class DownloaderTest(unittest.TestCase):
+
+    def setUp(self):
+        self.server = StandInServer(('127.0.0.1', 0), StandInHandler)
+        self.server.hits = {}
+        self.server.lock = threading.Lock()
+        self.thread = threading.Thread(target=self.server.serve_forever)
+        self.thread.daemon = True
+        self.thread.start()
+        self.base = 'http://127.0.0.1:%i' % self.server.server_address[1]
+        self.dirname = tempfile.mkdtemp()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        shutil.rmtree(self.dirname)
+
+    def downloader(self, **kwargs):
+        kwargs.setdefault('rate', None)
+        kwargs.setdefault('backoff', 0)
+        return Downloader(**kwargs)
+
+    def test_get(self):
+        self.assertEqual(self.downloader().get(self.base + '/ok/a'), 'body of /ok/a')
+
+    def test_redirect(self):
+        self.assertEqual(self.downloader().get(self.base + '/redirect'), 'body of /ok/redirected')
+
+    def test_retries_retryable_status(self):
+        body = self.downloader(retries=3).get(self.base + '/flaky/2/a')
+        self.assertEqual(body, 'body of /flaky/2/a')
+        self.assertEqual(self.server.hits['/flaky/2/a'], 3)
+
+    def test_gives_up_after_retries(self):
+        self.assertRaises(DownloadError, self.downloader(retries=2).get, self.base + '/flaky/5/a')
+        self.assertEqual(self.server.hits['/flaky/5/a'], 3)
+
+    def test_does_not_retry_missing(self):
+        self.assertRaises(DownloadError, self.downloader(retries=3).get, self.base + '/missing')
+        self.assertEqual(self.server.hits['/missing'], 1)
+
+    def test_save_all_reports_failures(self):
+        jobs = [ (self.base + path, os.path.join(self.dirname, name))
+                 for path, name in [('/ok/a', 'a'), ('/missing', 'b'), ('/flaky/1/c', 'c')] ]
+        results = dict([ (job[1], err) for job, path, err in self.downloader().save_all(jobs) ])
+        self.assertEqual(results[jobs[0][1]], None)
+        self.assertTrue(isinstance(results[jobs[1][1]], DownloadError))
+        self.assertEqual(results[jobs[2][1]], None)
+        self.assertFalse(os.path.exists(jobs[1][1]))
+        self.assertEqual(open(jobs[2][1], 'rb').read(), 'body of /flaky/1/c')
+
+    def test_rate_shared_across_workers(self):
+        d = self.downloader(rate=20, workers=4)
+        urls = [ self.base + '/ok/%i' % i for i in range(6) ]
+        start = time.time()
+        results = list(d.get_all(urls))
+        self.assertTrue(time.time() - start >= 5 / 20.)
+        self.assertEqual(sorted([ url for url, body, err in results if err is None ]), sorted(urls))
+
+    def test_mirror_revalidates(self):
+        mirror = Mirror(os.path.join(self.dirname, 'mirror'))
+        d = self.downloader(mirror=mirror)
+        path = os.path.join(self.dirname, 'versioned')
+        d.save(self.base + '/etag', path)
+        d.save(self.base + '/etag', path)
+        self.assertEqual(self.server.hits['/etag'], 2)
+        self.assertEqual(open(path, 'rb').read(), 'versioned body')
+
+
+class RateLimiterTest(unittest.TestCase):
+
+    def test_spaces_calls(self):
+        limiter = RateLimiter(50)
+        start = time.time()
+        for i in range(6):
+            limiter.wait()
+        self.assertTrue(time.time() - start >= 5 / 50.)
+
+    def test_unlimited(self):
+        limiter = RateLimiter(None)
+        start = time.time()
+        for i in range(100):
+            limiter.wait()
+        self.assertTrue(time.time() - start < 0.1)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,104 @@
+#!/usr/bin/python
+__version__ = ".01"
+__author__ = "gazzman"
+__copyright__ = "(C) gazzman GNU GPL 3."
+__contributors__ = []
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from sec.edgar_index import IndexEntry, filter_entries, index_submission, ingest_index, parse_index
+from sec.filing_catalog import FilingCatalog, Submission
+
+FIXTURES = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'fixtures')
+# the atom feed entry for 0000034088-13-000058, as FilingURLs.feed_submission gives it
+FEED_SUBMISSION = Submission('2013-11-05T17:08:04+00:00', '10-Q  - Quarterly report',
+                             'http://www.sec.gov/Archives/edgar/data/34088/000003408813000058/'
+                             '0000034088-13-000058-index.htm', '10-Q')
+
+
+def read_fixture(fname):
+    return list(parse_index(open(os.path.join(FIXTURES, fname), 'rb')))
+
+
+class ParseIndexTest(unittest.TestCase):
+
+    def test_form_columns(self):
+        entries = read_fixture('form.idx')
+        self.assertEqual(len(entries), 4)
+        self.assertEqual(entries[0], IndexEntry(66740, '3M CO', '10-K', '2013-02-14',
+                                                'edgar/data/66740/0000066740-13-000007.txt'))
+        self.assertEqual(entries[2].company, '21ST CENTURY HOLDING CO 2')
+        self.assertEqual(entries[2].cik, 1069996)
+        self.assertEqual(entries[3].form, 'SC 13G/A')
+        self.assertEqual(entries[3].company, 'SOME  HOLDER  CO')
+
+    def test_master_matches_form(self):
+        form = read_fixture('form.idx')
+        master = read_fixture('master.idx')
+        self.assertEqual([ e._replace(date=None) for e in master ],
+                         [ e._replace(date=None) for e in form ])
+
+    def test_daily_dates(self):
+        form = dict([ (e.fname, index_submission(e)) for e in read_fixture('form.idx') ])
+        for entry in read_fixture('master.idx'):
+            self.assertEqual(len(entry.date), 8)
+            self.assertEqual(index_submission(entry), form[entry.fname])
+        self.assertEqual(form['edgar/data/34088/0000034088-13-000058.txt'].date,
+                         '2013-11-05T00:00:00+00:00')
+
+    def test_filter_forms_and_ciks(self):
+        entries = read_fixture('form.idx')
+        self.assertEqual([ e.cik for e in filter_entries(entries) ], [66740, 34088, 1069996])
+        self.assertEqual([ e.cik for e in filter_entries(entries, ['10-q']) ], [34088, 1069996])
+        self.assertEqual([ e.cik for e in filter_entries(entries, ciks=[34088, 12345]) ], [34088])
+        self.assertEqual([ e.cik for e in filter_entries(entries, None, [12345]) ], [12345])
+
+
+class IngestIndexTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dirname = tempfile.mkdtemp()
+        self.catalog = FilingCatalog(os.path.join(self.dirname, 'edgar.db'))
+
+    def tearDown(self):
+        self.catalog.close()
+        shutil.rmtree(self.dirname)
+
+    def ingest(self, fname):
+        return ingest_index(open(os.path.join(FIXTURES, fname), 'rb'), self.catalog)
+
+    def test_reingest(self):
+        self.assertEqual(self.ingest('form.idx'), {66740: 1, 34088: 1, 1069996: 1})
+        self.assertEqual(self.ingest('form.idx'), {})
+        self.assertEqual(self.ingest('master.idx'), {})
+        self.assertEqual(len(self.catalog.query()), 3)
+
+    def test_skips_feed_submissions(self):
+        self.catalog.add_submissions(34088, [FEED_SUBMISSION])
+        self.assertEqual(self.ingest('form.idx'), {66740: 1, 1069996: 1})
+        self.assertEqual(self.catalog.submissions(34088).keys(), [FEED_SUBMISSION])
+
+    def test_feed_after_index(self):
+        self.ingest('form.idx')
+        self.catalog.add_submissions(34088, [FEED_SUBMISSION])
+        self.catalog.set_xbrl_urls(34088, FEED_SUBMISSION, ['http://www.sec.gov/a.xml'])
+        submissions = self.catalog.submissions(34088)
+        self.assertEqual(len(submissions), 1)
+        self.assertEqual(submissions.values(), [['http://www.sec.gov/a.xml']])
+
+    def test_dedupes_old_catalogs(self):
+        self.catalog.conn.execute('DROP INDEX submissions_accession')
+        self.catalog.conn.execute('INSERT INTO submissions (cik, date, title, sub_url, form)'
+                                  ' VALUES (?, ?, ?, ?, ?)', (34088,) + tuple(FEED_SUBMISSION))
+        self.catalog.conn.commit()
+        self.ingest('form.idx')
+        self.catalog.close()
+        self.catalog = FilingCatalog(os.path.join(self.dirname, 'edgar.db'))
+        self.assertEqual(self.catalog.submissions(34088).keys(), [FEED_SUBMISSION])
+
+
+if __name__ == '__main__':
+    unittest.main()
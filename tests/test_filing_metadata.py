@@ -0,0 +1,53 @@
+#!/usr/bin/python
+__version__ = ".01"
+__author__ = "gazzman"
+__copyright__ = "(C) gazzman GNU GPL 3."
+__contributors__ = []
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from sec import filing_metadata as fm
+from sec import xbrl_benchmark as xb
+from sec import xbrl_reader as xr
+
+
+class ReadDeiTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dirname = tempfile.mkdtemp()
+        self.base_fname = xb.generate_filing(self.dirname, facts=200, contexts=20, segments=4,
+                                             concepts=10)
+
+    def tearDown(self):
+        shutil.rmtree(self.dirname)
+
+    def add_document_type(self, before):
+        ''' Adds a dei:DocumentType fact before the first element
+            matching before
+        '''
+        fname = xr.ftype_fname(self.base_fname, 'instance')
+        instance = open(fname).read()
+        i = instance.index(before)
+        open(fname, 'w').write(instance[:i] + '<dei:DocumentType contextRef="C1">10-Q'
+                               '</dei:DocumentType>' + instance[i:])
+
+    def test_missing_tags(self):
+        self.assertEqual(fm.read_dei(self.base_fname),
+                         {'EntityCentralIndexKey': str(xb.CIK), 'DocumentPeriodEndDate': '2013-09-30',
+                          'DocumentFiscalYearFocus': '2013', 'DocumentFiscalPeriodFocus': 'Q3',
+                          'DocumentType': None})
+
+    def test_dei_block(self):
+        self.add_document_type('<dei:EntityCentralIndexKey')
+        self.assertEqual(fm.read_dei(self.base_fname)['DocumentType'], '10-Q')
+
+    def test_stops_after_dei_block(self):
+        self.add_document_type('</xbrli:xbrl>')
+        self.assertEqual(fm.read_dei(self.base_fname)['DocumentType'], None)
+
+
+if __name__ == '__main__':
+    unittest.main()
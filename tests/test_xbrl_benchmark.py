@@ -0,0 +1,61 @@
+#!/usr/bin/python
+__version__ = ".01"
+__author__ = "gazzman"
+__copyright__ = "(C) gazzman GNU GPL 3."
+__contributors__ = []
+
+import os
+import shutil
+import tempfile
+import unittest
+
+from sec import xbrl_benchmark as xb
+from sec import xbrl_reader as xr
+from sec import xbrl_tuple_reader as xtr
+
+
+class GenerateFilingTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dirname = tempfile.mkdtemp()
+        self.cwd = os.getcwd()
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.dirname)
+
+    def generate(self, **params):
+        base_fname = os.path.relpath(xb.generate_filing(self.dirname, **params), self.dirname)
+        os.chdir(self.dirname)
+        return base_fname
+
+    def test_facts_use_every_context(self):
+        base_fname = self.generate(facts=2000, contexts=100, segments=10,
+                                   taxonomies=2, concepts=20)
+        submission = xb.loaded(base_fname)
+        facts = [ e for e in submission['instance'].getroot() if 'contextRef' in e.attrib ]
+        used = set([ e.attrib['contextRef'] for e in facts ])
+        self.assertEqual(len(used), 100)
+        pairs = set([ (e.tag, e.attrib['contextRef']) for e in facts ])
+        self.assertEqual(len(pairs), len(facts))
+        contexts = xr.index_contexts(submission)
+        self.assertEqual(len([ c for c in contexts.values() if c.segments ]), 10)
+        self.assertTrue(min([ c.start or c.instant for c in contexts.values() ]) >= '2010-01-01')
+
+    def test_tuple_rows(self):
+        base_fname = self.generate(facts=2000, contexts=100, segments=10,
+                                   taxonomies=2, concepts=20)
+        tuples = xb.header_tag_tuples(2, 20)
+        headers, rowdicts = xtr.listify_data(xtr.extract_data(xb.loaded(base_fname), tuples),
+                                             tuples)
+        aligned = [ r for r, k in zip(rowdicts, xtr.aligned_mask(rowdicts)) if k ]
+        self.assertTrue(len([ r for r in rowdicts if r['Segments'] ]) >= 4)
+        self.assertTrue(len([ r for r in aligned if r['Segments'] ]) >= 2)
+        self.assertTrue(len([ h for h in headers if h.startswith('EoP ') ]) >= 10)
+        reported = xtr.filter_rowdicts(rowdicts)
+        self.assertEqual(len(reported), 1)
+        self.assertTrue(len([ k for k in reported[0] if k not in xtr.ROWKEY ]) >= 20)
+
+
+if __name__ == '__main__':
+    unittest.main()
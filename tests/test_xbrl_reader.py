@@ -0,0 +1,83 @@
+#!/usr/bin/python
+__version__ = ".01"
+__author__ = "gazzman"
+__copyright__ = "(C) gazzman GNU GPL 3."
+__contributors__ = []
+
+import os
+import re
+import shutil
+import tempfile
+import unittest
+
+from sec import xbrl_benchmark as xb
+from sec import xbrl_reader as xr
+
+DEI_FACT = r'<dei:(\w+) contextRef="\w+">[^<]*</dei:\1>'
+
+
+class StreamDataTest(unittest.TestCase):
+
+    def setUp(self):
+        self.dirname = tempfile.mkdtemp()
+        self.cwd = os.getcwd()
+        self.base_fname = os.path.relpath(xb.generate_filing(self.dirname, facts=400, contexts=20,
+                                                             segments=4, concepts=10),
+                                          self.dirname)
+        os.chdir(self.dirname)
+        self.requests = xb.data_requests(2)
+
+    def tearDown(self):
+        os.chdir(self.cwd)
+        shutil.rmtree(self.dirname)
+
+    def move_dei(self, order):
+        ''' Rewrites the instance with its dei facts, in the order of
+            their DEI_FIELDS indexes in order, among the last facts,
+            with a financial fact between each
+        '''
+        fname = xr.ftype_fname(self.base_fname, 'instance')
+        instance = open(fname).read()
+        dei = [ m.group(0) for m in re.finditer(DEI_FACT, instance) ]
+        instance = re.sub(DEI_FACT, '', instance)
+        facts = re.findall(r'<syn\d:\w+ [^>]*>\d+</syn\d:\w+>', instance)[-len(order):]
+        for i, fact in zip(order, facts):
+            instance = instance.replace(fact, fact + dei[i])
+        open(fname, 'w').write(instance)
+
+    def rows(self, read):
+        return sorted([ sorted(f.as_dict().items()) for f in read() ])
+
+    def extracted(self):
+        submission = xr.load_submission(self.base_fname, xr.submission_time(self.base_fname))
+        return xr.extract_data(submission, self.requests)
+
+    def streamed(self):
+        return xr.stream_data(self.base_fname, self.requests, xr.submission_time(self.base_fname))
+
+    def test_dei_after_facts(self):
+        self.move_dei([0, 1, 2, 3])
+        rows = self.rows(self.streamed)
+        self.assertEqual(len(rows), 400)
+        self.assertEqual(rows, self.rows(self.extracted))
+        self.assertEqual(set([ f['fiscal_period'] for f in self.streamed() ]), set(['2013Q3']))
+
+    def test_repeated_fiscal_focus(self):
+        self.move_dei([0, 1, 2, 3, 3])
+        self.assertEqual(set([ f['fiscal_period'] for f in self.extracted() ]), set([None]))
+        self.assertRaises(LookupError, self.rows, self.streamed)
+
+    def test_repeated_cik(self):
+        self.move_dei([0, 0, 1, 2, 3])
+        self.assertRaises(LookupError, self.extracted)
+        self.assertRaises(LookupError, self.rows, self.streamed)
+
+    def test_missing_fiscal_focus(self):
+        self.move_dei([0, 1])
+        rows = self.rows(self.streamed)
+        self.assertEqual(rows, self.rows(self.extracted))
+        self.assertEqual(set([ f['fiscal_period'] for f in self.streamed() ]), set([None]))
+
+
+if __name__ == '__main__':
+    unittest.main()
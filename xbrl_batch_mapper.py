@@ -0,0 +1,129 @@
+#!/usr/bin/python
+__version__ = ".01"
+__author__ = "gazzman"
+__copyright__ = "(C) gazzman GNU GPL 3."
+__contributors__ = []
+
+import argparse
+import csv
+import multiprocessing
+import os
+import pickle
+import sys
+
+from sec import filing_archive as fa
+from sec import filing_metadata as fm
+from sec import instrumentation as instr
+from sec import xbrl_reader as xr
+from sec import xbrl_tuple_generator as xtg
+
+REPORT_HEADERS = ['base_fname', 'field', 'reason']
+
+
+def parse_fields(lines):
+    ''' Parses lines of the form
+            FIELD: LABEL1 | LABEL2 | ...
+        into a list of (field, [labels]) tuples, in order of
+        preference. A line with no labels uses the field as its label.
+    '''
+    fields = []
+    for line in lines:
+        field, sep, labels = line.partition(':')
+        labels = [ l.strip() for l in labels.split('|') if l.strip() != '' ]
+        fields += [(field.strip(), labels or [field.strip()])]
+    return fields
+
+
+def resolve_field(submission, labels):
+    ''' Returns the tag of the first label that matches exactly one tag
+        and None, or None and the reason no tag was chosen
+    '''
+    reasons = []
+    for label in labels:
+        tags = []
+        for tag in xtg.label_tags(submission, label):
+            if tag not in tags: tags += [tag]
+        if len(tags) == 1:
+            return tags[0], None
+        elif len(tags) > 1:
+            reasons += ['\'%s\' is ambiguous: %s' % (label, ', '.join(tags))]
+        else:
+            reasons += ['\'%s\' not found' % label]
+    return None, '; '.join(reasons)
+
+
+def map_filing(task):
+    ''' Resolves the fields for one filing and pickles its header tag
+        tuples beside it, returning the pickle's filename and a list
+        of (field, reason) tuples for the unresolved fields
+    '''
+    base_fname, fields, ofext = task
+    try:
+        submission = xr.load_submission(base_fname, xr.submission_time(base_fname))
+        header_tags = []
+        unresolved = []
+        for field, labels in fields:
+            tag, reason = resolve_field(submission, labels)
+            if tag is None: unresolved += [(field, reason)]
+            else: header_tags += [(field, tag)]
+    except Exception as err:
+        return None, [ (field, 'filing not read: %r' % err) for field, labels in fields ]
+    ofname = fa.sidecar_fname('%s_%s' % (base_fname, ofext))
+    pickle.dump(header_tags, open(ofname, 'w'))
+    return ofname, unresolved
+
+
+def map_filings(base_fnames, fields, ofext, processes=None):
+    ''' Maps the fields for every filing across a process pool,
+        yielding (base_fname, ofname, unresolved) tuples in order
+    '''
+    pool = multiprocessing.Pool(processes)
+    try:
+        tasks = [ (base_fname, fields, ofext) for base_fname in base_fnames ]
+        results = instr.merged(pool.imap(instr.Collecting(map_filing), tasks))
+        for base_fname, (ofname, unresolved) in zip(base_fnames, results):
+            yield base_fname, ofname, unresolved
+    finally:
+        pool.terminate()
+
+
+if __name__ == '__main__':
+    ''' Command line utility for producing a pickle of header tag
+    tuples for every filing in a CIK directory without prompting
+
+    cik_dir: The directory of filings saved by the xbrl_retreiver.py
+             utility.
+    fields_fname: The filename of the fields to map, one per line,
+                  each optionally followed by a colon and the labels
+                  to try for it, separated by '|'.
+
+    Each filing's tuples are pickled to [BASE FILENAME]_[FIELDS FILENAME],
+    ready for xbrl_tuple_reader.py or xbrl_batch_reader.py --per-filing.
+    '''
+    description = 'Map fields to tags for every filing in a CIK directory.'
+
+    p = argparse.ArgumentParser(description=description)
+    p.add_argument('cik_dir', help="Directory of filings for a CIK")
+    p.add_argument('fields_fname', help="File of fields and their candidate labels")
+    p.add_argument('-j', '--jobs', type=int, default=None,
+                   help="Number of worker processes (default: number of cores)")
+    p.add_argument('--report', help="Write the unresolved fields to this csv file")
+    fm.add_selection_arguments(p)
+    args = p.parse_args()
+
+    fields = parse_fields(xr.listify_commented_file(args.fields_fname))
+    ofext = os.path.split(args.fields_fname)[-1]
+    report = []
+    for base_fname, ofname, unresolved in map_filings(fm.select_filings(args.cik_dir, args),
+                                                      fields, ofext, args.jobs):
+        if ofname is not None: print ofname
+        for field, reason in unresolved:
+            print >> sys.stderr, '%s: %s unresolved (%s)' % (os.path.basename(base_fname),
+                                                           field, reason)
+            report += [{'base_fname': base_fname, 'field': field, 'reason': reason}]
+    if args.report:
+        with open(args.report, 'wb') as f:
+            c = csv.DictWriter(f, REPORT_HEADERS)
+            c.writeheader()
+            c.writerows(report)
+    print >> sys.stderr, '%i unresolved fields.' % len(report)
@@ -0,0 +1,135 @@
+#!/usr/bin/python
+__version__ = ".01"
+__author__ = "gazzman"
+__copyright__ = "(C) gazzman GNU GPL 3."
+__contributors__ = []
+
+import argparse
+import csv
+import multiprocessing
+import os
+import pickle
+import sys
+
+from sec import filing_archive as fa
+from sec import filing_metadata as fm
+from sec import instrumentation as instr
+from sec import xbrl_reader as xr
+from sec import xbrl_tuple_reader as xtr
+
+
+def filing_tuples(base_fname, header_tag_tuples, per_filing_ext=None):
+    ''' Returns the header tag tuples a filing is read with: its own
+        in [BASE FILENAME]_[per_filing_ext] if given and they exist,
+        or header_tag_tuples
+    '''
+    if per_filing_ext:
+        per_filing_fname = fa.sidecar_fname('%s_%s' % (base_fname, per_filing_ext))
+        if os.path.exists(per_filing_fname):
+            return pickle.load(open(per_filing_fname, 'r'))
+    return header_tag_tuples
+
+
+def read_filing(task):
+    ''' Extracts the filtered tuple reader rows from a single filing
+    '''
+    base_fname, header_tag_tuples, per_filing_ext = task
+    try:
+        header_tag_tuples = filing_tuples(base_fname, header_tag_tuples, per_filing_ext)
+        submission = xr.load_submission(base_fname, xr.submission_time(base_fname))
+        rows = xtr.extract_data(submission, header_tag_tuples)
+    except Exception as err:
+        print >> sys.stderr, 'Skipping %s: %r' % (base_fname, err)
+        return []
+    headers, rowdicts = xtr.listify_data(rows, header_tag_tuples)
+    return xtr.filter_rowdicts(rowdicts)
+
+
+def read_filings(base_fnames, header_tag_tuples, processes=None, per_filing_ext=None):
+    ''' Fans the filings out across a process pool, yielding each
+        filing's rows in the order the filings were given
+
+    If per_filing_ext is given, a filing's own header tag tuples in
+    [BASE FILENAME]_[per_filing_ext] are used in place of
+    header_tag_tuples when they exist.
+    '''
+    pool = multiprocessing.Pool(processes)
+    try:
+        tasks = [ (base_fname, header_tag_tuples, per_filing_ext) for base_fname in base_fnames ]
+        for rowdicts in instr.merged(pool.imap(instr.Collecting(read_filing), tasks)):
+            yield rowdicts
+    finally:
+        pool.terminate()
+
+
+def batch_headers(base_fnames, header_tag_tuples, per_filing_ext=None):
+    ''' Returns the csv headers for every row the filings can give,
+        before any is read: the row key, then each field of their
+        header tag tuples as a duration and as BoP and EoP instants
+    '''
+    fields = set([ field for field, tag in header_tag_tuples ])
+    if per_filing_ext:
+        for base_fname in base_fnames:
+            fields.update([ field for field, tag in
+                            filing_tuples(base_fname, [], per_filing_ext) ])
+    data_headers = [ h for field in fields for h in (field, 'BoP %s' % field, 'EoP %s' % field) ]
+    data_headers.sort()
+    return list(xtr.ROWKEY) + data_headers
+
+
+def print_filings(headers, filings):
+    ''' Prints csv-formatted rows to stdout as each filing's arrive
+    '''
+    print ','.join(headers)
+    c = csv.DictWriter(sys.stdout, headers)
+    for rowdicts in filings:
+        c.writerows(rowdicts)
+        instr.count('rows.emitted', len(rowdicts))
+    print
+
+
+if __name__ == '__main__':
+    ''' Command line utility for printing the tuple reader data of
+    every filing in a CIK directory as a single csv
+
+    cik_dir: The directory of filings saved by the xbrl_retreiver.py
+             utility.
+    header_tag_tuples: The filename containing a pickled list of tuples
+                       as produced by xbrl_tuple_generator.py
+    '''
+    description = 'Extract tuple reader data from every filing in a CIK directory.'
+
+    p = argparse.ArgumentParser(description=description)
+    p.add_argument('cik_dir', help="Directory of filings for a CIK")
+    p.add_argument('header_tag_tuples', help="Pickled list of (field, tag) tuples")
+    p.add_argument('-j', '--jobs', type=int, default=None,
+                   help="Number of worker processes (default: number of cores)")
+    p.add_argument('--per-filing', metavar='EXT', 
+                   help=("Use each filing's own tuples in [BASE FILENAME]_EXT, as written by "
+                         + "xbrl_batch_mapper.py, where they exist"))
+    p.add_argument('--parquet', metavar='PATH', help="Write Parquet to PATH instead of csv to stdout")
+    p.add_argument('--partition', action="store_true", 
+                   help="Partition the Parquet output in PATH by CIK and period focus")
+    p.add_argument('--latest', action="store_true", 
+                   help="Keep only the latest-submitted row for each period, as for amended filings")
+    fm.add_selection_arguments(p)
+    args = p.parse_args()
+
+    header_tag_tuples = pickle.load(open(args.header_tag_tuples, 'r'))
+    base_fnames = fm.select_filings(args.cik_dir, args)
+    headers = batch_headers(base_fnames, header_tag_tuples, args.per_filing)
+    filings = read_filings(base_fnames, header_tag_tuples, args.jobs, args.per_filing)
+    if args.latest:
+        from sec import fact_resolver
+        resolver = fact_resolver.Resolver(fact_resolver.TUPLE_KEY, 'Submission Time', None)
+        for rowdicts in filings:
+            resolver.add_rows(rowdicts)
+        filings = [resolver.resolved()]
+    if args.parquet:
+        from sec import xbrl_parquet
+        sink = xbrl_parquet.tuple_sink(args.parquet, headers, args.partition)
+        for rowdicts in filings:
+            sink.write_rows(rowdicts)
+        sink.close()
+    else:
+        print_filings(headers, filings)
@@ -0,0 +1,320 @@
+#!/usr/bin/python
+__version__ = ".01"
+__author__ = "gazzman"
+__copyright__ = "(C) gazzman GNU GPL 3."
+__contributors__ = []
+
+from datetime import date
+import argparse
+import json
+import multiprocessing
+import os
+import platform
+import resource
+import shutil
+import sys
+import tempfile
+import time
+
+from sec import xbrl_reader as xr
+from sec import xbrl_tuple_generator as xtg
+from sec import xbrl_tuple_reader as xtr
+
+XSD = 'http://www.w3.org/2001/XMLSchema'
+LINK = 'http://www.xbrl.org/2003/linkbase'
+XLINK = 'http://www.w3.org/1999/xlink'
+DEI = 'http://xbrl.sec.gov/dei/2013-01-31'
+DEI_URI = 'http://xbrl.sec.gov/dei/2013/dei-2013-01-31.xsd'
+TAXONOMY = 'http://example.com/syn%i/2013-01-31'
+TAXONOMY_URI = 'http://example.com/syn%i/elts/syn%i-2013-01-31.xsd'
+LABEL_ROLE = 'http://www.xbrl.org/2003/role/label'
+CIK = 34088
+PERIOD_END = date(2013, 9, 30)
+PERIOD_QUARTERS = 12 # quarter ends the contexts cycle through
+SUBMISSION_TIME = '2013-11-05T17:08:04+00:00'
+BENCHMARKS = ['load_submission', 'extract_data', 'stream_data', 'tuple_extract_data',
+              'label_tags', 'print_data', 'tuple_print_data']
+
+
+def quarter_ends(n):
+    ''' Returns n quarter end dates, the latest PERIOD_END, oldest first
+    '''
+    ends = []
+    year, quarter = PERIOD_END.year, 3
+    for i in range(n):
+        month = 3*quarter
+        ends += [date(year, month, 31 if month in (3, 12) else 30)]
+        quarter -= 1
+        if quarter == 0: year, quarter = year - 1, 4
+    ends.reverse()
+    return ends
+
+
+def concept_names(concepts):
+    ''' Returns (name, period type) for each concept, alternating
+        between instants and durations
+    '''
+    return [ ('Concept%i' % i, ('instant', 'duration')[i % 2]) for i in range(concepts) ]
+
+
+def write_taxonomy(fname, namespace, concepts):
+    elements = [ ('<xs:element name="%s" id="x_%s" type="xbrli:monetaryItemType" '
+                  'xbrli:periodType="%s" xbrli:balance="debit" abstract="false" '
+                  'substitutionGroup="xbrli:item"/>') % (name, name, period_type)
+                 for name, period_type in concepts ]
+    with open(fname, 'w') as f:
+        f.write('<?xml version="1.0"?><xs:schema xmlns:xs="%s" xmlns:xbrli="%s" '
+                'targetNamespace="%s">%s</xs:schema>' % (XSD, xr.XBRLI, namespace, ''.join(elements)))
+
+
+def generate_filing(dirname, facts=10000, contexts=200, segments=20, taxonomies=2, concepts=200):
+    ''' Writes a synthetic filing, and the taxonomies it imports, into
+        dirname in the layout xbrl_retreiver.py produces, returning the
+        filing's base filename
+
+    The facts are spread evenly over taxonomies * concepts concepts and
+    every one of contexts contexts, without repeating a concept and
+    context while there are fewer facts than the two multiplied. The
+    contexts come in instant and duration pairs cycling back from
+    PERIOD_END over PERIOD_QUARTERS quarter ends, and segments of them,
+    spread among the rest starting at PERIOD_END, carry an explicit
+    member. Durations run from the start of the year, so the tuple
+    reader finds period boundaries and the PERIOD_END pairs give
+    period-aligned rows.
+    '''
+    schema_dir = os.path.join(dirname, xr.IMPORTED_SCHEMA_DIR)
+    cik_dir = os.path.join(dirname, str(CIK))
+    for d in (schema_dir, cik_dir):
+        if not os.path.exists(d): os.makedirs(d)
+    names = concept_names(concepts)
+    write_taxonomy(os.path.join(schema_dir, DEI_URI.split('/')[-1]), DEI,
+                   [ (name, 'duration') for name in xr.DEI_FIELDS ])
+    for t in range(taxonomies):
+        write_taxonomy(os.path.join(schema_dir, (TAXONOMY_URI % (t, t)).split('/')[-1]),
+                       TAXONOMY % t, names)
+
+    base_fname = os.path.join(cik_dir, '%s_10-Q_syn-%s' % (SUBMISSION_TIME, PERIOD_END.strftime('%Y%m%d')))
+    imports = [ '<xs:import namespace="%s" schemaLocation="%s"/>' % (TAXONOMY % t, TAXONOMY_URI % (t, t))
+                for t in range(taxonomies) ]
+    imports += ['<xs:import namespace="%s" schemaLocation="%s"/>' % (DEI, DEI_URI)]
+    with open(xr.ftype_fname(base_fname, 'schema'), 'w') as f:
+        f.write('<?xml version="1.0"?><xs:schema xmlns:xs="%s" xmlns:xbrli="%s" '
+                'targetNamespace="http://example.com/syn/20130930">%s</xs:schema>'
+                % (XSD, xr.XBRLI, ''.join(imports)))
+
+    ends = quarter_ends(min(max(1, contexts/2), PERIOD_QUARTERS))
+    segment_stride = max(1, contexts/segments) if segments else None
+    context_ids = {'instant': [], 'duration': []}
+    elements = []
+    for i in range(contexts):
+        pair = i/2
+        end = ends[-1 - pair % len(ends)]
+        if i % 2 == 0:
+            period_type = 'instant'
+            period = '<xbrli:instant>%s</xbrli:instant>' % end
+        else:
+            period_type = 'duration'
+            period = ('<xbrli:startDate>%s</xbrli:startDate><xbrli:endDate>%s</xbrli:endDate>'
+                      % (date(end.year, 1, 1), end))
+        segment = ''
+        if segment_stride and pair % segment_stride == 0 and 2*(pair/segment_stride) + i % 2 < segments:
+            segment = ('<xbrli:segment><xbrldi:explicitMember dimension="syn0:Axis">'
+                       'syn0:Member%i</xbrldi:explicitMember></xbrli:segment>' % i)
+        context_id = 'C%i' % i
+        context_ids[period_type] += [context_id]
+        elements += ['<xbrli:context id="%s"><xbrli:entity><xbrli:identifier scheme="'
+                     'http://www.sec.gov/CIK">%010i</xbrli:identifier>%s</xbrli:entity>'
+                     '<xbrli:period>%s</xbrli:period></xbrli:context>'
+                     % (context_id, CIK, segment, period)]
+    dei_context = context_ids['duration'][-1] if context_ids['duration'] else context_ids['instant'][-1]
+    dei_values = [str(CIK), str(PERIOD_END), str(PERIOD_END.year), 'Q3']
+    for name, value in zip(xr.DEI_FIELDS, dei_values):
+        elements += ['<dei:%s contextRef="%s">%s</dei:%s>' % (name, dei_context, value, name)]
+    elements += ['<xbrli:unit id="usd"><xbrli:measure>iso4217:USD</xbrli:measure></xbrli:unit>']
+    placed = {'instant': 0, 'duration': 0}
+    for i in range(facts):
+        t = i % taxonomies
+        name, period_type = names[(i / taxonomies) % concepts]
+        ids = context_ids[period_type] or context_ids['instant'] or context_ids['duration']
+        # the nth fact of a period type is the (n % per_round)th of its concepts, placed
+        # one context further along in each round through them
+        n = placed[period_type]
+        placed[period_type] += 1
+        per_round = taxonomies * len([ c for c in names if c[1] == period_type ])
+        context_id = ids[(n % per_round + n / per_round) % len(ids)]
+        elements += ['<syn%i:%s contextRef="%s" unitRef="usd" decimals="-6">%i</syn%i:%s>'
+                     % (t, name, context_id, 1000000*(i + 1), t, name)]
+    prefixes = ''.join([ ' xmlns:syn%i="%s"' % (t, TAXONOMY % t) for t in range(taxonomies) ])
+    with open(xr.ftype_fname(base_fname, 'instance'), 'w') as f:
+        f.write('<?xml version="1.0"?><xbrli:xbrl xmlns:xbrli="%s" xmlns:xbrldi="http://xbrl.org/2006/xbrldi"'
+                ' xmlns:dei="%s" xmlns:iso4217="http://www.xbrl.org/2003/iso4217"%s>%s</xbrli:xbrl>'
+                % (xr.XBRLI, DEI, prefixes, ''.join(elements)))
+
+    for ftype in ('cal', 'def', 'pre'):
+        with open(xr.ftype_fname(base_fname, ftype), 'w') as f:
+            f.write('<link:linkbase xmlns:link="%s"/>' % LINK)
+    labels = [ ('<link:label id="lab_syn%i_%s_1" xlink:label="lab_%s" xlink:role="%s">'
+                'Synthetic %i %s</link:label>') % (t, name, name, LABEL_ROLE, t, name)
+               for t in range(taxonomies) for name, period_type in names ]
+    with open(xr.ftype_fname(base_fname, 'lab'), 'w') as f:
+        f.write('<link:linkbase xmlns:link="%s" xmlns:xlink="%s"><link:labelLink>%s'
+                '</link:labelLink></link:linkbase>' % (LINK, XLINK, ''.join(labels)))
+    return base_fname
+
+
+def data_requests(taxonomies):
+    return [ 'syn%i:' % t for t in range(taxonomies) ]
+
+
+def header_tag_tuples(taxonomies, concepts):
+    return [ ('Synthetic %i %s' % (t, name), 'syn%i:%s' % (t, name))
+             for t in range(taxonomies) for name, period_type in concept_names(concepts) ]
+
+
+def loaded(base_fname):
+    return xr.load_submission(base_fname, xr.submission_time(base_fname), lazy=False)
+
+
+def run_benchmark(task):
+    ''' Runs one benchmark repeat times, returning the best and mean
+        seconds, the facts, labels or rows handled per run and per
+        second, and the peak RSS in kB
+    '''
+    name, base_fname, params, repeat = task
+    requests = data_requests(params['taxonomies'])
+    tuples = header_tag_tuples(params['taxonomies'], params['concepts'])
+    devnull = open(os.devnull, 'w')
+    times = []
+    for i in range(repeat):
+        unit = 'facts'
+        if name == 'load_submission':
+            start = time.time()
+            submission = loaded(base_fname)
+            xr.index_contexts(submission)
+            times += [time.time() - start]
+            count = len([ e for e in submission['instance'].getroot() if 'contextRef' in e.attrib ])
+        elif name == 'extract_data':
+            submission = loaded(base_fname)
+            start = time.time()
+            rows = xr.extract_data(submission, requests)
+            times += [time.time() - start]
+            count = len(rows)
+        elif name == 'stream_data':
+            start = time.time()
+            rows = list(xr.stream_data(base_fname, requests, xr.submission_time(base_fname)))
+            times += [time.time() - start]
+            count = len(rows)
+        elif name == 'tuple_extract_data':
+            submission = loaded(base_fname)
+            start = time.time()
+            rows = xtr.extract_data(submission, tuples)
+            times += [time.time() - start]
+            count = sum([ len(v) for v in rows.values() ])
+        elif name == 'label_tags':
+            unit = 'labels'
+            submission = loaded(base_fname)
+            start = time.time()
+            for label, tag in tuples:
+                xtg.label_tags(submission, label)
+            times += [time.time() - start]
+            count = len(tuples)
+        elif name in ('print_data', 'tuple_print_data'):
+            submission = loaded(base_fname)
+            if name == 'print_data':
+                rows = xr.extract_data(submission, requests)
+                write = lambda: xr.print_data(rows)
+            else:
+                unit = 'rows'
+                headers, rows = xtr.listify_data(xtr.extract_data(submission, tuples), tuples)
+                write = lambda: xtr.print_data(headers, rows)
+            stdout = sys.stdout
+            sys.stdout = devnull
+            try:
+                start = time.time()
+                write()
+                times += [time.time() - start]
+            finally:
+                sys.stdout = stdout
+            count = len(rows)
+        else:
+            raise ValueError('Unknown benchmark %s' % name)
+    best = min(times)
+    return {'name': name, 'seconds': best, 'mean_seconds': sum(times)/len(times), 
+            'unit': unit, 'count': count, 'per_sec': count/best if best > 0 else None,
+            'peak_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}
+
+
+def run_benchmarks(dirname, names=BENCHMARKS, repeat=3, **params):
+    ''' Generates a synthetic filing in dirname and runs each benchmark
+        in a fresh process from within dirname, so imported schemas are
+        read from its imported_schemas and nothing is fetched
+    '''
+    base_fname = generate_filing(dirname, **params)
+    cwd = os.getcwd()
+    os.chdir(dirname)
+    try:
+        base_fname = os.path.relpath(base_fname, dirname)
+        xr.get_schema_index(TAXONOMY_URI % (0, 0)) # build the schema index pickles once
+        results = []
+        for name in names:
+            pool = multiprocessing.Pool(1)
+            try:
+                results += [pool.apply(run_benchmark, ((name, base_fname, params, repeat),))]
+            finally:
+                pool.terminate()
+    finally:
+        os.chdir(cwd)
+    return {'params': dict(params, repeat=repeat), 'python': platform.python_version(),
+            'lxml': '.'.join([ str(v) for v in xr.etree.LXML_VERSION ]),
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'), 'benchmarks': results}
+
+
+def compare(report, baseline):
+    ''' Yields (name, baseline seconds, seconds, speedup) for the
+        benchmarks in both reports
+    '''
+    old = dict([ (b['name'], b) for b in baseline['benchmarks'] ])
+    for b in report['benchmarks']:
+        if b['name'] in old and b['seconds'] > 0:
+            yield b['name'], old[b['name']]['seconds'], b['seconds'], old[b['name']]['seconds']/b['seconds']
+
+
+if __name__ == '__main__':
+    ''' Command line utility for benchmarking the readers on a
+    synthetic filing, entirely offline
+
+    Prints a JSON report of each benchmark's best and mean wall time
+    over --repeat runs, the facts (or rows, contexts or labels) handled
+    per second and the peak RSS of the process that ran it. Save a
+    report and pass it to --compare on a later run to see the speedups.
+    '''
+    description = 'Benchmark the XBRL readers on a synthetic filing.'
+
+    p = argparse.ArgumentParser(description=description)
+    p.add_argument('--facts', type=int, default=10000, help="Number of facts")
+    p.add_argument('--contexts', type=int, default=200, help="Number of contexts")
+    p.add_argument('--segments', type=int, default=20, help="Number of segmented contexts")
+    p.add_argument('--taxonomies', type=int, default=2, help="Number of imported taxonomies")
+    p.add_argument('--concepts', type=int, default=200, help="Number of concepts per taxonomy")
+    p.add_argument('--repeat', type=int, default=3, help="Runs per benchmark")
+    p.add_argument('--only', action='append', choices=BENCHMARKS, help="Run only this benchmark")
+    p.add_argument('--dir', help="Generate the filing in this directory and keep it")
+    p.add_argument('-o', '--output', help="Write the JSON report to this file instead of stdout")
+    p.add_argument('--compare', metavar='REPORT', help="A previous JSON report to compare against")
+    args = p.parse_args()
+
+    dirname = args.dir or tempfile.mkdtemp(prefix='xbrl_benchmark')
+    try:
+        report = run_benchmarks(dirname, args.only or BENCHMARKS, args.repeat, facts=args.facts,
+                                contexts=args.contexts, segments=args.segments,
+                                taxonomies=args.taxonomies, concepts=args.concepts)
+    finally:
+        if not args.dir: shutil.rmtree(dirname)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2, sort_keys=True)
+    else:
+        print json.dumps(report, indent=2, sort_keys=True)
+    if args.compare:
+        for name, old, new, speedup in compare(report, json.load(open(args.compare))):
+            print >> sys.stderr, '%-20s %9.4fs -> %9.4fs  %5.2fx' % (name, old, new, speedup)
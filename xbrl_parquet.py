@@ -0,0 +1,182 @@
+#!/usr/bin/python
+__version__ = ".01"
+__author__ = "gazzman"
+__copyright__ = "(C) gazzman GNU GPL 3."
+__contributors__ = []
+
+from datetime import datetime
+import os
+import uuid
+
+try:
+    import pyarrow as pa
+    import pyarrow.parquet as pq
+except ImportError:
+    pa = None
+
+ROW_GROUP_SIZE = 65536
+DEFAULT_PARTITION = '__HIVE_DEFAULT_PARTITION__'
+DATEFMT = '%Y-%m-%d'
+TIMEFMT = '%Y-%m-%dT%H:%M:%S'
+
+
+def to_date(value):
+    if not value: return None
+    return datetime.strptime(value.strip()[:10], DATEFMT).date()
+
+
+def to_timestamp(value):
+    ''' Parses a submission time such as 2013-11-05T17:08:04+00:00
+    '''
+    if not value: return None
+    return datetime.strptime(value[:19], TIMEFMT)
+
+
+def to_int(value):
+    try: return int(value)
+    except (TypeError, ValueError): return None
+
+
+def to_float(value):
+    try: return float(value)
+    except (TypeError, ValueError): return None
+
+
+def to_text(value):
+    ''' Keeps only the values that are not numbers
+    '''
+    if value is None or to_float(value) is not None: return None
+    return value
+
+
+def to_str(value):
+    return value
+
+
+def fact_columns():
+    ''' Columns for the rows of xbrl_reader.extract_data as
+        (name, arrow type, row key, converter) tuples. Numeric values
+        go in value and any other value in text. A decimals of INF is
+        stored as null.
+    '''
+    return [('cik', pa.int64(), 'cik', to_int),
+            ('fiscal_period', pa.string(), 'fiscal_period', to_str),
+            ('period_end_date', pa.date32(), 'period_end_date', to_date),
+            ('submission_time', pa.timestamp('s'), 'submission_time', to_timestamp),
+            ('tag', pa.string(), 'tag', to_str),
+            ('value', pa.float64(), 'value', to_float),
+            ('text', pa.string(), 'value', to_text),
+            ('unit', pa.string(), 'unit', to_str),
+            ('decimals', pa.int32(), 'decimals', to_int),
+            ('start', pa.date32(), 'start', to_date),
+            ('end', pa.date32(), 'end', to_date),
+            ('segments', pa.string(), 'segments', to_str),
+    ]
+
+
+def tuple_columns(headers):
+    ''' Columns for the rowdicts of xbrl_tuple_reader.listify_data
+    '''
+    key_columns = {'CIK': (pa.int64(), to_int),
+                   'Reporting Period End Date': (pa.date32(), to_date),
+                   'Submission Time': (pa.timestamp('s'), to_timestamp),
+                   'Segments': (pa.string(), to_str),
+                   'Submission Period Focus': (pa.string(), to_str),
+                   'Period Start': (pa.date32(), to_date),
+                   'Period End': (pa.date32(), to_date),
+    }
+    columns = []
+    for header in headers:
+        arrow_type, converter = key_columns.get(header, (pa.float64(), to_float))
+        columns += [(header, arrow_type, header, converter)]
+    return columns
+
+
+class ParquetSink:
+    """ParquetSink: Writes rows to Parquet with typed columns
+
+    Rows are buffered and written out as a row group every
+    row_group_size rows, so memory stays bounded however many rows
+    are streamed in. Without partition_cols, path is a single file.
+    With them, path is a directory of hive-style partitions such as
+    path/cik=34088/fiscal_period=2013Q3/part-<id>.parquet, and the
+    partition columns are left out of the files themselves.
+
+    """
+
+    def __init__(self, path, columns, partition_cols=None, row_group_size=ROW_GROUP_SIZE):
+        if pa is None:
+            raise ImportError('pyarrow is required for Parquet output')
+        self.path = path
+        self.partition_cols = list(partition_cols or [])
+        self.row_group_size = row_group_size
+        self.columns = [ c for c in columns if c[0] not in self.partition_cols ]
+        self.partition_columns = dict([ (c[0], c) for c in columns if c[0] in self.partition_cols ])
+        self.schema = pa.schema([ pa.field(name, arrow_type) for name, arrow_type, k, f in self.columns ])
+        self.part_name = 'part-%s.parquet' % uuid.uuid4().hex
+        self.buffers = {}
+        self.writers = {}
+
+    def partition(self, row):
+        key = []
+        for col in self.partition_cols:
+            name, arrow_type, row_key, converter = self.partition_columns[col]
+            value = row.get(row_key)
+            if value is None: value = DEFAULT_PARTITION
+            key += ['%s=%s' % (name, str(value).replace('/', '_'))]
+        return tuple(key)
+
+    def write(self, row):
+        key = self.partition(row)
+        buf = self.buffers.setdefault(key, [ [] for c in self.columns ])
+        for values, (name, arrow_type, row_key, converter) in zip(buf, self.columns):
+            values.append(converter(row.get(row_key)))
+        if len(buf[0]) >= self.row_group_size:
+            self.flush(key)
+
+    def write_rows(self, rows):
+        for row in rows:
+            self.write(row)
+
+    def flush(self, key=None):
+        if key is None: keys = self.buffers.keys()
+        else: keys = [key]
+        for key in keys:
+            buf = self.buffers.pop(key, None)
+            if not buf or len(buf[0]) == 0: continue
+            arrays = [ pa.array(values, type=arrow_type)
+                       for values, (name, arrow_type, k, f) in zip(buf, self.columns) ]
+            table = pa.Table.from_arrays(arrays, schema=self.schema)
+            if key not in self.writers:
+                if self.partition_cols:
+                    dirname = os.path.join(self.path, *key)
+                    if not os.path.exists(dirname): os.makedirs(dirname)
+                    fname = os.path.join(dirname, self.part_name)
+                else:
+                    fname = self.path
+                self.writers[key] = pq.ParquetWriter(fname, self.schema)
+            self.writers[key].write_table(table)
+
+    def close(self):
+        self.flush()
+        for writer in self.writers.values():
+            writer.close()
+        self.writers = {}
+
+
+def fact_sink(path, partition=False, row_group_size=ROW_GROUP_SIZE):
+    ''' A ParquetSink for xbrl_reader rows, partitioned by CIK and
+        fiscal period if partition is True
+    '''
+    if partition: partition_cols = ['cik', 'fiscal_period']
+    else: partition_cols = None
+    return ParquetSink(path, fact_columns(), partition_cols, row_group_size)
+
+
+def tuple_sink(path, headers, partition=False, row_group_size=ROW_GROUP_SIZE):
+    ''' A ParquetSink for xbrl_tuple_reader rowdicts, partitioned by
+        CIK and submission period focus if partition is True
+    '''
+    if partition: partition_cols = ['CIK', 'Submission Period Focus']
+    else: partition_cols = None
+    return ParquetSink(path, tuple_columns(headers), partition_cols, row_group_size)
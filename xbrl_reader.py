@@ -4,22 +4,24 @@ __author__ = "gazzman"
 __copyright__ = "(C) gazzman GNU GPL 3."
 __contributors__ = []
 
+from collections import namedtuple
+try: from collections import OrderedDict # >= 2.7
+except ImportError: from ordereddict import OrderedDict # 2.6
 from datetime import datetime
-from StringIO import StringIO
+import argparse
 import csv
 import lxml.etree as etree
 import os
+import pickle
 import re
 import sys
-import urllib2
-
-try: from sec.xbrl_retreiver import IMPORTED_SCHEMA_DIR, SERVER, UASTRING
-except ImportError: 
-    IMPORTED_SCHEMA_DIR = 'imported_schemas'
-    SERVER = 'http://sec.gov'
-    UASTRING=('Mozilla/5.0 (X11; Linux x86_64; rv:10.0.5) Gecko/20120606'
-              + 'Firefox/10.0.5')
-HEADER = {'User-Agent' : UASTRING}
+import time
+
+from sec import filing_archive as fa
+from sec import instrumentation as instr
+from sec.edgar_constants import HEADER, IMPORTED_SCHEMA_DIR, SERVER, UASTRING
+from sec.edgar_downloader import Downloader, Mirror, write_atomic
+
 FTYPES = ['schema', # schema: contains detailed info about tag
           'instance', # instance: contains the data
           'cal', # calculation linkbase
@@ -29,6 +31,111 @@ FTYPES = ['schema', # schema: contains detailed info about tag
 ]
 DATA_HEADERS = ['cik', 'period_end_date', 'submission_time', 'tag', 'value', 
                 'start', 'end', 'segments']
+FACT_FIELDS = DATA_HEADERS + ['unit', 'decimals', 'fiscal_period']
+DEI_FIELDS = ['EntityCentralIndexKey', 'DocumentPeriodEndDate', 
+              'DocumentFiscalYearFocus', 'DocumentFiscalPeriodFocus']
+
+XBRLI = 'http://www.xbrl.org/2003/instance'
+XSD = 'http://www.w3.org/2001/XMLSchema'
+TAG_RE = re.compile('{(.*)}(.*)')
+SCHEMA_CACHE_SIZE = 8
+SCHEMA_INDEX_ATTRIBS = [('periodType', '{%s}periodType' % XBRLI),
+                        ('type', 'type'),
+                        ('balance', '{%s}balance' % XBRLI),
+                        ('abstract', 'abstract'),
+]
+
+Context = namedtuple('Context', ['start', 'end', 'instant', 'segments', 'entity'])
+
+
+class Fact(object):
+    """Fact: A single extracted fact
+
+    A slotted record of the FACT_FIELDS, in place of a dict per fact.
+    A Fact reads like the row dict it replaces, so fact['tag'],
+    fact.get('unit') and DictWriter all work on it, and as_dict
+    returns a plain dict where one is really needed.
+
+    """
+
+    __slots__ = FACT_FIELDS
+    fields = frozenset(FACT_FIELDS)
+    __hash__ = None # mutable, like the row dict it replaces
+
+    def __init__(self, cik, period_end_date, submission_time, tag, value, start=None, end=None,
+                 segments=None, unit=None, decimals=None, fiscal_period=None):
+        self.cik = cik
+        self.period_end_date = period_end_date
+        self.submission_time = submission_time
+        self.tag = tag
+        self.value = value
+        self.start = start
+        self.end = end
+        self.segments = segments
+        self.unit = unit
+        self.decimals = decimals
+        self.fiscal_period = fiscal_period
+
+    def __getitem__(self, key):
+        if key not in self.fields: raise KeyError(key)
+        return getattr(self, key)
+
+    def get(self, key, default=None):
+        if key not in self.fields: return default
+        return getattr(self, key)
+
+    def __contains__(self, key):
+        return key in self.fields
+
+    def __iter__(self):
+        return iter(FACT_FIELDS)
+
+    def keys(self):
+        return list(FACT_FIELDS)
+
+    def items(self):
+        return [ (f, getattr(self, f)) for f in FACT_FIELDS ]
+
+    def __getstate__(self):
+        return tuple([ getattr(self, f) for f in FACT_FIELDS ])
+
+    def __setstate__(self, state):
+        for f, v in zip(FACT_FIELDS, state):
+            setattr(self, f, v)
+
+    def __eq__(self, other):
+        return isinstance(other, Fact) and self.__getstate__() == other.__getstate__()
+
+    def __ne__(self, other):
+        return not self == other
+
+    def __repr__(self):
+        return 'Fact(%s)' % ', '.join([ '%s=%r' % (f, getattr(self, f)) for f in FACT_FIELDS ])
+
+    def as_dict(self):
+        return dict(self.items())
+
+
+def intern_str(s):
+    ''' Interns byte strings so repeated tags, units and dates are
+        stored once, leaving None and unicode as they are
+    '''
+    if type(s) is str: return intern(s)
+    return s
+
+# fixed queries, compiled once
+SCHEMA_IMPORT_XPATH = etree.XPath('//xsd:import[@namespace=$namespace]', namespaces={'xsd': XSD})
+SCHEMA_ELEMENT_XPATH = etree.XPath('//xsd:element[@name=$name]', namespaces={'xsd': XSD})
+CONTEXT_XPATH = etree.XPath('//xbrli:context', namespaces={'xbrli': XBRLI})
+ENTITY_XPATH = etree.XPath('./xbrli:entity', namespaces={'xbrli': XBRLI})
+PERIOD_XPATH = etree.XPath('./xbrli:period', namespaces={'xbrli': XBRLI})
+IDENTIFIER_XPATH = etree.XPath('./xbrli:identifier', namespaces={'xbrli': XBRLI})
+SEGMENT_XPATH = etree.XPath('./xbrli:segment', namespaces={'xbrli': XBRLI})
+
+# process-wide LRUs of parsed imported schemas and their indexes, keyed by uri
+schema_cache = OrderedDict()
+schema_index_cache = OrderedDict()
+shared_downloader = None
 
 
 def snake_title(string):
@@ -36,8 +143,21 @@ def snake_title(string):
     return re.sub('(?!^)(A|[A-Z]+)', r'_\1', string).lower() # thanks nickl-
 
 
-def get_schema(uri, refresh=False):
-    ''' Gets and parses a schema file from disk or web
+def lru_get(cache, key):
+    value = cache.pop(key)
+    cache[key] = value
+    return value
+
+
+def lru_put(cache, key, value, size=SCHEMA_CACHE_SIZE):
+    cache[key] = value
+    while len(cache) > size:
+        cache.popitem(last=False)
+
+
+def fetch_schema(uri, refresh=False):
+    ''' Downloads a schema file to IMPORTED_SCHEMA_DIR if needed and
+        returns its path
     '''
     fname = uri.split('/')[-1]
     rel_path = '%s/%s' % (IMPORTED_SCHEMA_DIR, fname)
@@ -48,39 +168,155 @@ def get_schema(uri, refresh=False):
     if refresh == True or not os.path.exists(rel_path):
         outmsg = 'Grabbing schema %s' % fname
         print >> sys.stderr, outmsg
-        req = urllib2.Request(uri, headers=HEADER)
-        page = urllib2.urlopen(req)
-        with open(rel_path, 'wb') as f:
-            f.write(page.read())
-    return etree.parse(rel_path)
+        before = file_signature(rel_path)
+        with instr.timer('schema.fetch'):
+            schema_downloader().save(uri, rel_path)
+        if file_signature(rel_path) != before:
+            schema_cache.pop(uri, None)
+            schema_index_cache.pop(uri, None)
+            if os.path.exists('%s.index' % rel_path): os.remove('%s.index' % rel_path)
+    return rel_path
+
+
+def file_signature(path):
+    try:
+        st = os.stat(path)
+        return (st.st_ino, st.st_size, st.st_mtime)
+    except OSError:
+        return None
+
+
+def schema_downloader():
+    ''' Returns the Downloader shared by schema fetches, which
+        revalidates schemas against the local mirror
+    '''
+    global shared_downloader
+    if shared_downloader is None: shared_downloader = Downloader(HEADER, mirror=Mirror())
+    return shared_downloader
+
+
+def get_schema(uri, refresh=False):
+    ''' Gets and parses a schema file from disk or web
+    '''
+    rel_path = fetch_schema(uri, refresh)
+    try:
+        schema = lru_get(schema_cache, uri)
+        instr.count('schema_cache.hits')
+        return schema
+    except KeyError:
+        instr.count('schema_cache.misses')
+        with instr.timer('schema.parse'):
+            schema = etree.parse(rel_path)
+        lru_put(schema_cache, uri, schema)
+        return schema
+
+
+def index_schema(schema):
+    ''' Maps the name of each element declared in a parsed schema to
+        a dict of its periodType, type, balance and abstract attributes
+    '''
+    index = OrderedDict()
+    element_tag = '{%s}element' % root_ns(schema)['None']
+    for e in schema.getroot().iterchildren(tag=element_tag):
+        if 'name' in e.attrib:
+            index[e.attrib['name']] = dict([ (k, e.attrib.get(a)) for k, a in SCHEMA_INDEX_ATTRIBS ])
+    return index
+
+
+def cached_index(index_path, source_mtime, build):
+    ''' Returns the object pickled at index_path, unless it is missing,
+        unreadable or older than source_mtime, in which case it is
+        built and pickled there. The pickle is written atomically, so
+        concurrent readers never load a partial one, and failing to
+        write it, as in a read-only directory, is not an error.
+    '''
+    try:
+        if os.path.getmtime(index_path) >= source_mtime:
+            with open(index_path, 'rb') as f:
+                return pickle.load(f)
+    except Exception:
+        pass # missing or unreadable, rebuild it
+    index = build()
+    try:
+        write_atomic(index_path, pickle.dumps(index, pickle.HIGHEST_PROTOCOL))
+    except (IOError, OSError) as err:
+        print >> sys.stderr, 'Could not store %s: %s' % (index_path, err)
+    return index
+
+
+def get_schema_index(uri, refresh=False):
+    ''' Gets the element index of an imported schema, building it and
+        storing it next to the schema file on disk if needed
+    '''
+    rel_path = fetch_schema(uri, refresh)
+    try:
+        index = lru_get(schema_index_cache, uri)
+        instr.count('schema_index_cache.hits')
+        return index
+    except KeyError:
+        instr.count('schema_index_cache.misses')
+    index = cached_index('%s.index' % rel_path, os.path.getmtime(rel_path),
+                         lambda: index_schema(get_schema(uri)))
+    lru_put(schema_index_cache, uri, index)
+    return index
+
+
+def schema_location(namespace, submission):
+    ''' Returns the uri the submission schema imports a namespace from,
+        looked up once per namespace
+    '''
+    locations = submission.setdefault('schema_locations', {})
+    if namespace not in locations:
+        schema_imports = SCHEMA_IMPORT_XPATH(submission['schema'], namespace=namespace)
+        if len(schema_imports) == 1: locations[namespace] = schema_imports[0].attrib['schemaLocation']
+        else: locations[namespace] = None
+    assert locations[namespace] is not None
+    return locations[namespace]
 
 
 def load_schema(namespace, submission, refresh=False):
     ''' Loads a schema into the submission dictionary   
     '''
     if namespace not in submission or refresh == True:
-        schema_imports = submission['schema'].xpath("//None:import[@namespace='%s']" % namespace, 
-                                                    namespaces=root_ns(submission['schema']))
-        assert len(schema_imports) == 1
-        schema_url = schema_imports[0].attrib['schemaLocation']
-        submission[namespace] = get_schema(schema_url)
+        submission[namespace] = get_schema(schema_location(namespace, submission))
+
+
+def load_schema_index(namespace, submission):
+    ''' Returns the element index for a namespace, falling back to
+        the submission schema if the namespace is not imported
+    '''
+    try:
+        return get_schema_index(schema_location(namespace, submission))
+    except AssertionError:
+        if 'schema_index' not in submission:
+            submission['schema_index'] = index_schema(submission['schema'])
+        return submission['schema_index']
+
+
+def get_tag_info(tag, submission):
+    ''' Returns the schema index entry for the tag in question
+    '''
+    m = TAG_RE.match(tag)
+    if not m: raise Exception('Tag does not match pattern.')
+    info = load_schema_index(m.group(1), submission).get(m.group(2))
+    if info is None:
+        print >> sys.stderr, '%s not found in schema' % tag
+    return info
 
 
 def get_tag_schema(tag, submission):
     ''' Returns the schema element for the tag in question
     '''
-    m = re.match('{(.*)}(.*)', tag)
+    m = TAG_RE.match(tag)
     if not m: raise Exception('Tag does not match pattern.')
     namespace = m.group(1)
     name = m.group(2)
 
     try: # tag schema in an imported schema
         load_schema(namespace, submission)
-        tag_schemas = submission[namespace].xpath("//None:element[@name='%s']" % name, 
-                                                  namespaces=root_ns(submission['schema']))
+        tag_schemas = SCHEMA_ELEMENT_XPATH(submission[namespace], name=name)
     except AssertionError: # tag schema not imported
-        tag_schemas = submission['schema'].xpath("//None:element[@name='%s']" % name, 
-                                                 namespaces=root_ns(submission['schema']))
+        tag_schemas = SCHEMA_ELEMENT_XPATH(submission['schema'], name=name)
     try:
         assert len(tag_schemas) == 1
     except AssertionError:
@@ -91,23 +327,72 @@ def get_tag_schema(tag, submission):
     return tag_schemas[0]
 
 
-def load_submission(base_fname, submission_time=None):
-    submission = {}
-    for ftype in FTYPES:
+def ftype_fname(base_fname, ftype):
+    if ftype == 'schema': return '%s.xsd' % base_fname
+    elif ftype == 'instance': return '%s.xml' % base_fname
+    else: return '%s_%s.xml' % (base_fname, ftype)
+
+
+def submission_time(base_fname):
+    return os.path.basename(base_fname).split('_')[0]
+
+
+def list_filings(dirname):
+    ''' Returns the base filenames of the submissions saved in a
+        directory, or packed into an archive, by xbrl_retreiver.py,
+        oldest first
+    '''
+    if os.path.isfile(dirname): fnames = fa.members(dirname)
+    else: fnames = os.listdir(dirname)
+    bases = [ os.path.join(dirname, f[:-4]) for f in fnames if f[-4:] == '.xsd' ]
+    bases.sort(key=lambda b: (submission_time(b), b))
+    return bases
+
+
+class LazySubmission(dict):
+    """LazySubmission: A submission dict that parses its files on demand
+
+    Each file in FTYPES is parsed the first time its key is looked up.
+    The seconds spent parsing each file are kept in parse_times, keyed
+    by ftype.
+
+    """
+
+    def __init__(self, base_fname, submission_time=None):
+        dict.__init__(self)
+        self.base_fname = base_fname
+        self.parse_times = {}
+        self.missing = set()
+        self['time'] = submission_time
+
+    def __missing__(self, key):
+        if key not in FTYPES or key in self.missing: raise KeyError(key)
+        start = time.time()
         try:
-            if ftype == 'schema':
-                submission[ftype] = etree.parse('%s.xsd' % base_fname)
-            elif ftype == 'instance':
-                submission[ftype] = etree.parse('%s.xml' % base_fname)
-            else:
-                submission[ftype] = etree.parse('%s_%s.xml' % (base_fname, ftype))
-        except IOError as err:
-                print >> sys.stderr, '%s s missing' % ftype.upper()
-    submission['time'] = submission_time
+            self[key] = etree.parse(fa.open_source(ftype_fname(self.base_fname, key)))
+        except IOError:
+            print >> sys.stderr, '%s s missing' % key.upper()
+            self.missing.add(key)
+            raise KeyError(key)
+        self.parse_times[key] = time.time() - start
+        instr.record('parse.%s' % key, self.parse_times[key])
+        return self[key]
+
+
+def load_submission(base_fname, submission_time=None, lazy=True):
+    submission = LazySubmission(base_fname, submission_time)
+    if not lazy:
+        for ftype in FTYPES:
+            try: submission[ftype]
+            except KeyError: pass
     return submission
 
 
 def clean_instance_namespace(submission):    
+    ''' Returns the instance's prefix to namespace map with the default
+        namespace given the xbrli prefix, built once per submission
+    '''
+    if 'instance_namespace' in submission: return submission['instance_namespace']
     instance_namespace = submission['instance'].getroot().nsmap
     if None in instance_namespace:
         try:
@@ -115,15 +400,26 @@ def clean_instance_namespace(submission):
         except KeyError:    
             instance_namespace.update(root_ns(submission['instance'], root_tag='xbrli'))
             instance_namespace.pop(None)
+    submission['instance_namespace'] = instance_namespace
     return instance_namespace
 
 
+def tag_elements(submission, namespace, name):
+    ''' Returns an iterator over the instance elements of a tag, in
+        document order
+    '''
+    return submission['instance'].getroot().iter('{%s}%s' % (namespace, name))
+
+
 def get_singleton_tag_value(submission, tag):
-    try:
-        v = submission['instance'].xpath('./%s' % tag, namespaces=submission['instance'].getroot().nsmap)
-    except TypeError:
-        inst_ns = clean_instance_namespace(submission)
-        v = submission['instance'].xpath('./%s' % tag, namespaces=inst_ns)
+    singletons = submission.setdefault('singletons', {})
+    if tag not in singletons:
+        namespace_key, name = tag.split(':')
+        namespace = clean_instance_namespace(submission).get(namespace_key)
+        root = submission['instance'].getroot()
+        if namespace is None: singletons[tag] = []
+        else: singletons[tag] = list(root.iterchildren(tag='{%s}%s' % (namespace, name)))
+    v = singletons[tag]
 
     try:
         assert len(v) == 1
@@ -142,76 +438,234 @@ def listify_commented_file(fname, comment_symbol='#'):
     return lines
 
 
+def segment_info(entity):
+    ''' Flattens the segments of a context entity into a single string
+    '''
+    info = None
+    for segment in SEGMENT_XPATH(entity):
+        for d in segment.iterdescendants():
+            descendant_info = ', '.join([str(d.attrib), d.text or ''])
+            try:
+                info = '; '.join([info, descendant_info])
+            except TypeError:
+                info = descendant_info
+    return info
+
+
+def parse_context(context):
+    ''' Parses a context element into a Context
+    '''
+    entity = ENTITY_XPATH(context)[0]
+    period = PERIOD_XPATH(context)[0]
+    identifier = IDENTIFIER_XPATH(entity)
+    values = {}
+    for e in period.iterchildren(tag=etree.Element):
+        values[etree.QName(e).localname] = e.text
+    fields = (values.get('startDate'), values.get('endDate'), values.get('instant'),
+              segment_info(entity), identifier[0].text if identifier else None)
+    return Context(*[ intern_str(f) for f in fields ])
+
+
+def index_contexts(submission):
+    ''' Parses every context in the instance once, returning a dict
+        of context id to Context
+    '''
+    if 'contexts' in submission: return submission['contexts']
+    contexts = {}
+    for context in CONTEXT_XPATH(submission['instance']):
+        contexts[context.attrib['id']] = parse_context(context)
+    submission['contexts'] = contexts
+    return contexts
+
+
+def namespace_facts(submission, namespaces):
+    ''' Walks the instance once, returning a dict of each namespace
+        to its facts in document order
+    '''
+    by_namespace = dict([ (namespace, []) for namespace in namespaces ])
+    if len(by_namespace) == 0: return by_namespace
+    for e in submission['instance'].getroot().iter(tag=etree.Element):
+        if e.tag[0] != '{' or 'contextRef' not in e.attrib: continue
+        facts = by_namespace.get(e.tag[1:e.tag.index('}')])
+        if facts is not None: facts.append(e)
+    return by_namespace
+
+
+def make_fact(e, context, tag, period_type, cik, period_end_date, submission_time, fiscal_period):
+    if period_type == 'instant': start, end = context.instant, None
+    elif period_type == 'duration': start, end = context.start, context.end
+    else: start, end = None, None
+    return Fact(cik, period_end_date, submission_time, tag, e.text, start, end, context.segments,
+                intern_str(e.attrib.get('unitRef')), intern_str(e.attrib.get('decimals')), 
+                fiscal_period)
+
+
+@instr.timed('extract_data')
 def extract_data(submission, data_requests):
-    ''' Extracts data into a list of dicts
+    ''' Extracts data into a list of Facts
     '''
     rows = []
     cik = int(get_singleton_tag_value(submission, 'dei:EntityCentralIndexKey'))
     period_end_date = get_singleton_tag_value(submission, 'dei:DocumentPeriodEndDate')
+    try:
+        fiscal_period = '%s%s' % (get_singleton_tag_value(submission, 'dei:DocumentFiscalYearFocus'),
+                                  get_singleton_tag_value(submission, 'dei:DocumentFiscalPeriodFocus'))
+    except LookupError:
+        fiscal_period = None
     inst_ns = clean_instance_namespace(submission)
-    for data_request in data_requests:
-        namespace_key, name = data_request.split(':')
-        namespace = submission['instance'].getroot().nsmap[namespace_key]
+    contexts = index_contexts(submission)
+    requests = [ data_request.split(':') for data_request in data_requests ]
+    by_namespace = namespace_facts(submission, set([ inst_ns[namespace_key] for namespace_key, name 
+                                                     in requests if name.strip() == '' ]))
+    for namespace_key, name in requests:
+        namespace = inst_ns[namespace_key]
         if name.strip() == '':
-            try:
-                load_schema(namespace, submission)
-                names = [ e.attrib['name'] for e in submission[namespace].xpath('//None:element',
-                                                                               namespaces=root_ns(submission[namespace])) ]
-            except AssertionError:
-                names = [ e.attrib['name'] for e in submission['schema'].xpath('//None:element',
-                                                                               namespaces=root_ns(submission['schema'])) ]
-        else: names = [name]
-
-        for name in names:
-            tag = '%s:%s' % (namespace_key, name)
-            schema = get_tag_schema('{%s}%s' % (namespace, name), submission)
-            if schema is not None:
-                period_type = schema.attrib["{%s}periodType" % inst_ns['xbrli']]
-                for r in submission['instance'].xpath('//%s' % tag, namespaces=inst_ns):
-                    row = {'cik': cik, 'period_end_date': period_end_date, 
-                           'submission_time': submission['time'], 'tag': tag, 
-                           'value': r.text, 'segments': None}
-                    context_ref = r.attrib['contextRef']
-                    context = submission['instance'].xpath("//xbrli:context[@id='%s']" % context_ref, namespaces=inst_ns)
-                    assert len(context) == 1
-                    context = context[0]
-
-                    entity = context.xpath("./xbrli:entity", namespaces=inst_ns)[0]
-                    period = context.xpath("./xbrli:period", namespaces=inst_ns)[0]
-
-                    if period_type == 'instant': 
-                        row['start'] = period.xpath("./xbrli:instant", namespaces=inst_ns)[0].text
-                        row['end'] = None
-                    elif period_type == 'duration': 
-                        row['start'] = period.xpath("./xbrli:startDate", namespaces=inst_ns)[0].text
-                        row['end'] = period.xpath("./xbrli:endDate", namespaces=inst_ns)[0].text
-
-#                    identifier = entity.xpath("./xbrli:identifier[@scheme]", namespaces=inst_ns)
-#                    assert len(identifier) == 1
-#                    identifier = identifier[0]
-
-                    segments = entity.xpath('./xbrli:segment', namespaces=inst_ns)
-                    for segment in segments:
-                        for d in segment.iterdescendants():
-                            if d.text is None: d.text = ''
-                            descendant_info = ', '.join([str(d.attrib), d.text])
-                            try:
-                                row['segments'] = '; '.join([row['segments'], descendant_info])
-                            except TypeError as err:
-                                row['segments'] = descendant_info
-                    rows += [row]
+            # in schema order, then document order, as if each name had been requested
+            index = load_schema_index(namespace, submission)
+            position = dict([ (n, i) for i, n in enumerate(index) ])
+            facts = []
+            for r in by_namespace[namespace]:
+                name = r.tag[len(namespace) + 2:]
+                if name in position: facts += [(position[name], name, r)]
+            facts.sort(key=lambda f: f[0])
+            tags = {}
+            for i, name, r in facts:
+                if name not in tags: tags[name] = intern_str('%s:%s' % (namespace_key, name))
+                rows += [make_fact(r, contexts[r.attrib['contextRef']], tags[name],
+                                   index[name]['periodType'], cik, period_end_date, 
+                                   submission['time'], fiscal_period)]
+        else:
+            tag = intern_str('%s:%s' % (namespace_key, name))
+            info = get_tag_info('{%s}%s' % (namespace, name), submission)
+            if info is not None:
+                for r in tag_elements(submission, namespace, name):
+                    rows += [make_fact(r, contexts[r.attrib['contextRef']], tag, info['periodType'],
+                                       cik, period_end_date, submission['time'], fiscal_period)]
+    instr.count('facts.extract_data', len(rows))
     return rows
 
 
+def dei_value(dei, field):
+    ''' Returns a dei field's value given each field's values, raising
+        LookupError as get_singleton_tag_value does unless it has one
+    '''
+    values = dei.get(field, [])
+    if len(values) > 1: raise LookupError('Submission has more than one dei:%s' % field)
+    if len(values) == 0: raise LookupError('Submission has no dei:%s' % field)
+    return values[0]
+
+
+def dei_submission_fields(dei):
+    ''' Returns the cik, period end date and fiscal period, or None,
+        given each of a submission's dei fields' values, as
+        extract_data works them out
+    '''
+    cik = int(dei_value(dei, 'EntityCentralIndexKey'))
+    period_end_date = dei_value(dei, 'DocumentPeriodEndDate')
+    try:
+        fiscal_period = '%s%s' % (dei_value(dei, 'DocumentFiscalYearFocus'),
+                                  dei_value(dei, 'DocumentFiscalPeriodFocus'))
+    except LookupError:
+        fiscal_period = None
+    return cik, period_end_date, fiscal_period
+
+
+def stream_data(base_fname, data_requests, submission_time=None):
+    ''' Extracts data from the instance in a single streaming pass,
+        yielding the same Facts as extract_data
+
+    Elements are cleared as soon as they have been read, so memory use
+    does not grow with the size of the instance. Facts that appear
+    before their context, or before every one of DEI_FIELDS, are held
+    back until those have been read, or the end of the instance for a
+    filing missing some of DEI_FIELDS. The dei values are read through
+    to the end, and a repeated one raises LookupError as in
+    extract_data, or where it would change the rows already yielded.
+    Rows are yielded as they resolve rather than in request order.
+    '''
+    context_tag = '{%s}context' % XBRLI
+    contexts = {}
+    pending = OrderedDict() # facts waiting on their context or the dei values, by contextRef
+    dei = {} # each of DEI_FIELDS' values
+    root = None
+    yielded = [0]
+
+    submission_fields = None # shared by every Fact, set once the dei values are read
+
+    def make_row(fact):
+        instr.count('facts.stream_data')
+        yielded[0] += 1
+        tag, value, context_ref, unit, decimals = fact
+        context = contexts[context_ref]
+        cik, period_end_date, fiscal_period = submission_fields
+        if context.instant is not None: start, end = context.instant, None
+        else: start, end = context.start, context.end
+        return Fact(cik, period_end_date, submission_time, tag, value, start, end, 
+                    context.segments, unit, decimals, fiscal_period)
+
+    instance = fa.open_source(ftype_fname(base_fname, 'instance'))
+    for event, e in etree.iterparse(instance, events=('start', 'end')):
+        if root is None:
+            root = e
+            nsmap = root.nsmap
+            requests = {}
+            for data_request in data_requests:
+                namespace_key, name = data_request.split(':')
+                requests[(nsmap[namespace_key], name.strip() or None)] = namespace_key
+            dei_namespace = nsmap.get('dei')
+            continue
+        if event == 'start': continue
+
+        qname = etree.QName(e)
+        if e.tag == context_tag:
+            context_id = e.attrib['id']
+            contexts[context_id] = parse_context(e)
+            if submission_fields is not None:
+                for fact in pending.pop(context_id, []): yield make_row(fact)
+        elif 'contextRef' in e.attrib:
+            if (qname.namespace == dei_namespace and qname.localname in DEI_FIELDS
+                and e.getparent() is root):
+                dei.setdefault(qname.localname, []).append(e.text)
+                if submission_fields is not None:
+                    repeated_fields = dei_submission_fields(dei)
+                    if repeated_fields != submission_fields and yielded[0] > 0:
+                        raise LookupError('Submission has more than one dei:%s' % qname.localname)
+                    submission_fields = repeated_fields
+            namespace_key = requests.get((qname.namespace, qname.localname), 
+                                         requests.get((qname.namespace, None)))
+            if namespace_key is not None:
+                fact = (intern_str('%s:%s' % (namespace_key, qname.localname)), e.text, 
+                        e.attrib['contextRef'], intern_str(e.attrib.get('unitRef')), 
+                        intern_str(e.attrib.get('decimals')))
+                if submission_fields is not None and fact[2] in contexts: yield make_row(fact)
+                else: pending.setdefault(fact[2], []).append(fact)
+            if submission_fields is None and len(dei) == len(DEI_FIELDS):
+                submission_fields = dei_submission_fields(dei)
+                for context_ref in [ c for c in pending if c in contexts ]:
+                    for fact in pending.pop(context_ref): yield make_row(fact)
+
+        if e.getparent() is root:
+            e.clear()
+            while e.getprevious() is not None:
+                del root[0]
+
+    if submission_fields is None: submission_fields = dei_submission_fields(dei)
+    for facts in pending.values():
+        for fact in facts:
+            yield make_row(fact)
+
+
 def print_data(rows):
     ''' Print csv-formatted data to stdout
     '''
-    s = StringIO()
-    c = csv.DictWriter(s, DATA_HEADERS)
-    c.writerows(rows)
-    s.seek(0)
     print ','.join(DATA_HEADERS)
-    print s.read()
+    c = csv.DictWriter(sys.stdout, DATA_HEADERS, extrasaction='ignore')
+    emitted = 0
+    for row in rows:
+        c.writerow(row)
+        emitted += 1
+    instr.count('rows.emitted', emitted)
+    print
 
 
 def root_ns(parsed_etree, root_tag='None'):
@@ -231,11 +685,28 @@ if __name__ == '__main__':
                           XBRL instance will be printed.   
 
     '''
-    base_fname = sys.argv[1]
-    reporting_data_fname = sys.argv[2]
-
-    submission_time = base_fname.split('/')[-1].split('_')[0]
-    submission = load_submission(base_fname, submission_time)
-    data_requests = listify_commented_file(reporting_data_fname)
-    rows = extract_data(submission, data_requests)
-    print_data(rows)
+    description = 'Simple utility for printing XBRL instance data.'
+
+    p = argparse.ArgumentParser(description=description)
+    p.add_argument('base_fname', help="Base filename of the XBRL submission")
+    p.add_argument('reporting_data_fname', help="File of [NAMESPACE]:[TAG NAME] requests")
+    p.add_argument('--stream', action="store_true", 
+                   help="Extract in a single streaming pass over the instance")
+    p.add_argument('--parquet', metavar='PATH', help="Write Parquet to PATH instead of csv to stdout")
+    p.add_argument('--partition', action="store_true", 
+                   help="Partition the Parquet output in PATH by CIK and fiscal period")
+    args = p.parse_args()
+
+    data_requests = listify_commented_file(args.reporting_data_fname)
+    if args.stream:
+        rows = stream_data(args.base_fname, data_requests, submission_time(args.base_fname))
+    else:
+        submission = load_submission(args.base_fname, submission_time(args.base_fname))
+        rows = extract_data(submission, data_requests)
+    if args.parquet:
+        from sec import xbrl_parquet
+        sink = xbrl_parquet.fact_sink(args.parquet, args.partition)
+        sink.write_rows(rows)
+        sink.close()
+    else:
+        print_data(rows)
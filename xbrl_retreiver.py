@@ -5,13 +5,12 @@ __author__ = "gazzman"
 __copyright__ = "(C) gazzman GNU GPL 3."
 __contributors__ = []
 
-from collections import namedtuple
 try: from collections import OrderedDict # >= 2.7
 except ImportError: from ordereddict import OrderedDict # 2.6
 import argparse
+import json
 import lxml.etree as etree
 import os
-import pickle
 import re
 import sys
 import time
@@ -20,27 +19,108 @@ import urllib2
 from BeautifulSoup import BeautifulSoup
 import feedparser
 
-UASTRING=('Mozilla/5.0 (X11; Linux x86_64; rv:10.0.5) Gecko/20120606'
-            + 'Firefox/10.0.5')
-HEADER = {'User-Agent' : UASTRING}
-SERVER = 'http://sec.gov'
+from sec import filing_archive as fa
+from sec import filing_metadata as fm
+from sec import instrumentation as instr
+from sec.edgar_constants import HEADER, IMPORTED_SCHEMA_DIR, SERVER, UASTRING
+from sec.edgar_downloader import Downloader, Mirror, MIRROR_DIR, RATE, WORKERS
+from sec.filing_catalog import CATALOG_FNAME, FilingCatalog, Submission, accession_number
+
 DATEFORMAT = '%Y-%m-%dT%H:%M:%S'
-IMPORTED_SCHEMA_DIR = 'imported_schemas'
 
-Submission = namedtuple('Submission', ['date', 'title', 'sub_url', 'form'])
+
+def merge_submissions(newer, older):
+    """Merges two lists of submissions sorted newest first into one
+    OrderedDict, keeping any xbrl urls already stored for the older
+
+    """
+    merged = OrderedDict()
+    i = 0
+    for s, urls in older:
+        while i < len(newer) and newer[i].date >= s.date:
+            merged[newer[i]] = None
+            i += 1
+        merged[s] = urls
+    for s in newer[i:]:
+        merged[s] = None
+    return merged
+
+
+def load_ticker_map(fname):
+    """Loads one of EDGAR's ticker to CIK mapping files into a dict
+    keyed by upper-case symbol
+
+    Accepts company_tickers.json, company_tickers_exchange.json and
+    the tab separated ticker.txt.
+
+    """
+    with open(fname, 'rb') as f:
+        data = f.read()
+    ticker_map = {}
+    try:
+        entries = json.loads(data)
+    except ValueError:
+        for line in data.splitlines():
+            fields = line.split()
+            if len(fields) == 2:
+                ticker_map[fields[0].upper()] = int(fields[1])
+        return ticker_map
+    if 'fields' in entries:
+        entries = [ dict(zip(entries['fields'], e)) for e in entries['data'] ]
+        key = 'cik'
+    else:
+        entries = entries.values()
+        key = 'cik_str'
+    for e in entries:
+        ticker_map[str(e['ticker']).upper()] = int(e[key])
+    return ticker_map
+
 
 class CIKFinder:
-    def __init__(self, filename='cikmap.pkl'):
+    def __init__(self, filename='cikmap.pkl', catalog=None, ticker_map_fname=None):
         self.filename = filename
-        try:
-            self.cik_dict = pickle.load(open(self.filename, 'rb'))
-        except IOError:
-            msg = 'No pickled cik file found, generating new pickle file.'
-            print >> sys.stdout, msg
-            self.cik_dict = {}
+        self.catalog = catalog or FilingCatalog()
+        if len(self.catalog.cik_dict()) == 0 and os.path.exists(self.filename):
+            print >> sys.stderr, 'Importing %s into the filing catalog.' % self.filename
+            self.catalog.import_cikmap(self.filename)
+        self.ticker_map = {}
+        if ticker_map_fname is not None:
+            self.ticker_map = load_ticker_map(ticker_map_fname)
+
+    def get_ciks(self, symbols, refresh=False):
+        """Resolves a list of symbols in one call, returning a dict of
+        symbol to CIK, or None where no CIK was found
+
+        Symbols are looked up in the catalog, then the ticker map, and
+        only scraped from EDGAR when neither has them.
+
+        """
+        if refresh is True: known = {}
+        else: known = self.catalog.cik_dict()
+        ciks = {}
+        mapped = {}
+        misses = []
+        for symbol in symbols:
+            if symbol in known:
+                ciks[symbol] = known[symbol]
+            elif symbol.upper() in self.ticker_map:
+                ciks[symbol] = mapped[symbol] = self.ticker_map[symbol.upper()]
+            else:
+                misses += [symbol]
+        self.catalog.set_ciks(mapped)
+        for symbol in misses:
+            try:
+                ciks[symbol] = self.get_cik(symbol, refresh=True)
+            except Exception as err:
+                print >> sys.stderr, err
+                ciks[symbol] = None
+        return ciks
 
     def get_cik(self, symbol, refresh=False):
-        if symbol not in self.cik_dict or refresh is True:
+        try:
+            if refresh is True: raise KeyError(symbol)
+            cik = self.catalog.lookup_cik(symbol)
+        except KeyError:
             url = (SERVER + '/cgi-bin/browse-edgar?company=&match=&CIK=' + 
                    symbol + '&filenum=&State=&Country=&SIC=&owner=exclude&' + 
                    'Find=Find+Companies&action=getcompany')
@@ -51,42 +131,49 @@ class CIKFinder:
             try:
                 info = info.getText().partition('CIK#:')[2]
             except AttributeError:
-                self.cik_dict[symbol] = None
-                pickle.dump(self.cik_dict, open(self.filename, 'wb'))
+                self.catalog.set_cik(symbol, None)
                 raise Exception('No CIK found for %s' % symbol)
                 
-            self.cik_dict[symbol] = int(info.split(' ')[0])
-            pickle.dump(self.cik_dict, open(self.filename, 'wb'))
-        elif self.cik_dict[symbol] == None:
+            cik = int(info.split(' ')[0])
+            self.catalog.set_cik(symbol, cik)
+        if cik == None:
             raise Exception('No CIK found for %s' % symbol)
-        return self.cik_dict[symbol]
+        return cik
 
 class FilingURLs:
     """FilingURLs: Gets the filing URLs of SEC filings for a cik
 
     A FilingURLs is initialized with the entity's cik integer 
-    and a list of strings denoting form names.
+    and a list of strings denoting form names. Filings are fetched
+    with the Downloader passed in, or one limited to RATE requests
+    per second. Submissions and their XBRL urls are kept in the
+    FilingCatalog passed in, or the one in CATALOG_FNAME. With archive
+    True, saved filings are packed into [CIK].zip instead of being
+    left in the [CIK] directory.
 
     """
 
-    def __init__(self, cik):
+    def __init__(self, cik, downloader=None, catalog=None, archive=False):
+        self.downloader = downloader or Downloader(HEADER, mirror=Mirror())
+        self.catalog = catalog or FilingCatalog()
         self.dirname = '%i/' % cik
+        self.archive_fname = fa.archive_fname(self.dirname) if archive else None
         if not os.path.exists(self.dirname):
             os.makedirs(self.dirname)
         if not os.path.exists(IMPORTED_SCHEMA_DIR):
             os.makedirs(IMPORTED_SCHEMA_DIR)
         self.cik = cik
         self.sub_urlfile = '%i_submissions.pkl' % cik
-        try:
-            self.submissions = pickle.load(open(self.sub_urlfile, 'rb'))
-        except IOError as err:
-            if re.search('No such file', str(err)):
-                message = ('No pickled submission url data.'
-                           + ' Run \'pull_submission_urls\' to populate list.')
-                print >> sys.stderr, message
-                self.submissions = OrderedDict()
-            else:
-                raise err
+        self.submissions = self.catalog.submissions(cik)
+        if len(self.submissions) == 0 and os.path.exists(self.sub_urlfile):
+            print >> sys.stderr, 'Importing %s into the filing catalog.' % self.sub_urlfile
+            self.catalog.import_submissions(cik, self.sub_urlfile, 
+                                            '%i_submissions.ckpt' % cik)
+            self.submissions = self.catalog.submissions(cik)
+        if len(self.submissions) == 0:
+            message = ('No submission url data.'
+                       + ' Run \'pull_submission_urls\' to populate list.')
+            print >> sys.stderr, message
 
     def feed_url(self, cik, start):
         return (SERVER 
@@ -104,128 +191,240 @@ class FilingURLs:
                     return True
         return False
 
-    def pull_submission_urls(self, refresh=False, verbose=False):
+    def parse_feed(self, start, verbose=False):
+        if verbose:
+            print self.feed_url(self.cik, start)
+        return feedparser.parse(self.downloader.get(self.feed_url(self.cik, start)))
+
+    def feed_submission(self, e):
+        title = e.title.encode('UTF-8')
+        form = title.partition(' ')[0]
+        url = e.link
+        date = (time.strftime(DATEFORMAT, e['updated_parsed']) 
+                + '+00:00')
+        return Submission(date, title, url, form)
+
+    def last_synced(self):
+        """Returns the time the submission urls were last pulled, or None"""
+        return self.catalog.last_synced(self.cik)
+
+    def record_sync(self):
+        self.catalog.record_sync(self.cik, time.strftime(DATEFORMAT, time.gmtime()) + '+00:00')
+
+    @instr.timed('filing_urls.pull_submission_urls')
+    def pull_submission_urls(self, refresh=False, verbose=False, incremental=False):
         """Parse the rss feed for the cik and store the urls,
            titles, and dates
 
         Keyword arguments:
-        refresh -- will refresh from web even if data had been pickled
+        refresh -- will refresh from web even if data had been stored
         verbose -- Print extra information
+        incremental -- only page through the feed until a submission
+                       that is already stored is reached
 
         """
-        if len(self.submissions) == 0 or refresh is True:
+        if incremental is True and len(self.submissions) > 0:
+            self.sync_submission_urls(verbose)
+        elif len(self.submissions) == 0 or refresh is True:
             start = 0
-            d = feedparser.parse(self.feed_url(self.cik, start))
+            known = set([ accession_number(s.sub_url) for s in self.submissions ])
+            d = self.parse_feed(start, verbose)
             while len(d.entries) > 0:
-                if verbose:
-                    print self.feed_url(self.cik, start)
                 start += 100
+                newer = []
                 for e in d.entries:
-                    title = e.title.encode('UTF-8')
-                    form = title.partition(' ')[0]
-                    url = e.link
-                    date = (time.strftime(DATEFORMAT, e['updated_parsed']) 
-                            + '+00:00')
-                    s = Submission(date, title, url, form)
-                    if s not in self.submissions:
+                    s = self.feed_submission(e)
+                    if accession_number(s.sub_url) not in known:
+                        known.add(accession_number(s.sub_url))
                         self.submissions[s] = None
-                d = feedparser.parse(self.feed_url(self.cik, start))
+                        newer += [s]
+                self.catalog.add_submissions(self.cik, newer)
+                instr.count('filing_urls.new_submissions', len(newer))
+                d = self.parse_feed(start, verbose)
             self.submissions = OrderedDict(sorted(self.submissions.items(), 
                                                   key=lambda d: d[0].date, 
                                                   reverse=True))
-            pickle.dump(self.submissions, open(self.sub_urlfile, 'wb'))
+            self.record_sync()
         elif verbose:
             outmsg = ('Already pulled submission urls.'
                      + ' Pass \'refresh=True\' to refresh anew.')
             print >> sys.stderr, outmsg
         print >> sys.stderr, 'Submission URLs pulled.'
 
-    def pull_xbrl_urls(self, refresh=False, verbose=False):
-        """Grabs XBRL filing urls and pickles them
+    @instr.timed('filing_urls.sync_submission_urls')
+    def sync_submission_urls(self, verbose=False):
+        """Pulls only the submissions newer than those already stored"""
+        previous_sync = self.last_synced()
+        known = set([ accession_number(s.sub_url) for s in self.submissions ])
+        newer = []
+        start = 0
+        synced = False
+        while not synced:
+            d = self.parse_feed(start, verbose)
+            if len(d.entries) == 0: break
+            start += 100
+            for e in d.entries:
+                s = self.feed_submission(e)
+                if accession_number(s.sub_url) in known:
+                    synced = True
+                    break
+                newer += [s]
+        if len(newer) > 0:
+            newer.sort(key=lambda s: s.date, reverse=True)
+            self.catalog.add_submissions(self.cik, newer)
+            self.submissions = merge_submissions(newer, self.submissions.items())
+            instr.count('filing_urls.new_submissions', len(newer))
+        self.record_sync()
+        print >> sys.stderr, '%i new submissions since %s.' % (len(newer), previous_sync)
+
+    @instr.timed('filing_urls.pull_xbrl_urls')
+    def pull_xbrl_urls(self, refresh=False, verbose=False, incremental=False):
+        """Grabs XBRL filing urls and stores them in the catalog
+
+        Index pages are fetched concurrently through the downloader.
+        Each result is committed to the catalog as it arrives, so an
+        interrupted run picks up where it stopped.
 
         Keyword arguments:
-        refresh -- will refresh from web even if data had been pickled
+        refresh -- will refresh from web even if data had been stored
         verbose -- Print extra information
+        incremental -- only pull submissions newer than those stored
 
         """
-        self.pull_submission_urls(refresh, verbose)
+        self.pull_submission_urls(refresh, verbose, incremental)
         self.tens = [ s for s in self.submissions if '10-q' in s.title.lower() 
                                                   or '10-k' in s.title.lower() ]
-        for ten in self.tens:
-            if refresh is True or self.submissions[ten] is None:
-                req = urllib2.Request(ten.sub_url, headers=HEADER)
-                page = urllib2.urlopen(req)
-                soup = BeautifulSoup(page)
-                table = soup.find(name='table', attrs={'summary': 'Data Files'})
-                try:
-                    self.submissions[ten] = [ '%s%s' % (SERVER, a['href'])
-                        for a in table.findAll(name='a')]
-                    outmsg = '%s on %s xbrl url stored.' % (ten.title, ten.date)
-                    print >> sys.stderr, outmsg
-                except AttributeError:
-                    self.submissions[ten] = []
-                    outmsg = '%s on %s has no xbrl filings.' % (ten.title, ten.date)
-                    print >> sys.stderr, outmsg
-        pickle.dump(self.submissions, open(self.sub_urlfile, 'wb'))
+        pending = dict([ (ten.sub_url, ten) for ten in self.tens
+                         if refresh is True or self.submissions[ten] is None ])
+        for url, page, err in self.downloader.get_all(pending):
+            ten = pending[url]
+            if err is not None:
+                outmsg = 'Failed to pull %s on %s: %s' % (ten.title, ten.date, err)
+                print >> sys.stderr, outmsg
+                continue
+            soup = BeautifulSoup(page)
+            table = soup.find(name='table', attrs={'summary': 'Data Files'})
+            try:
+                self.submissions[ten] = [ '%s%s' % (SERVER, a['href'])
+                    for a in table.findAll(name='a')]
+                outmsg = '%s on %s xbrl url stored.' % (ten.title, ten.date)
+                print >> sys.stderr, outmsg
+            except AttributeError:
+                self.submissions[ten] = []
+                outmsg = '%s on %s has no xbrl filings.' % (ten.title, ten.date)
+                print >> sys.stderr, outmsg
+            self.catalog.set_xbrl_urls(self.cik, ten, self.submissions[ten])
+            instr.count('filing_urls.index_pages')
         print >> sys.stderr, 'XBRL URLs pulled.'
 
+    @instr.timed('filing_urls.save_xbrl_filings')
     def save_xbrl_filings(self, refresh=False):
         """Grabs XBRL filings and stores them on disk
 
         Keyword arguments:
-        refresh -- will refresh from web even if data had been pickled
+        refresh -- will refresh from web even if data had been stored
 
         """
+        jobs = []
+        schema_fnames = []
+        archived = set(fa.members(self.archive_fname)) if self.archive_fname else set()
         for ten in self.tens:
             form = ten.title.split()[0]
-            for url in self.submissions[ten]:
+            for url in self.submissions[ten] or []:
                 fname = '%s_%s_%s' % (ten.date, form, url.split('/')[-1])
                 fname = fname.replace('/', '_')
-                if refresh == True or not os.path.exists('%s/%s' % (self.dirname, fname)):
-                    outmsg = 'Grabbing %s' % fname
-                    print >> sys.stderr, outmsg
-                    req = urllib2.Request(url, headers=HEADER)
-                    page = urllib2.urlopen(req)
-                    with open('%s/%s' % (self.dirname, fname), 'w') as f:
-                        f.write(page.read())
+                saved = fname in archived or os.path.exists('%s/%s' % (self.dirname, fname))
+                if refresh == True or not saved:
+                    jobs += [(url, '%s/%s' % (self.dirname, fname))]
                 print fname
                 if '.xsd' == fname[-4:]:
-                    self.schema_fname = fname
-                    self.import_additional_schemas(refresh=refresh)
-                    
+                    schema_fnames += [fname]
+        self.download(jobs)
+        if len(schema_fnames) > 0:
+            self.schema_fname = schema_fnames[-1]
+            self.import_additional_schemas(refresh=refresh, schema_fnames=schema_fnames)
+        if self.archive_fname:
+            fnames = fa.filing_fnames(self.dirname)
+            fa.pack(self.archive_fname, fnames)
+            if len(fnames) > 0:
+                print >> sys.stderr, 'Packed %i files into %s' % (len(fnames), self.archive_fname)
+        if self.archive_fname and os.path.exists(self.archive_fname):
+            metadata = fm.FilingMetadata(self.archive_fname)
+        else:
+            metadata = fm.FilingMetadata(self.dirname)
+        metadata.update()
+        metadata.close()
         print >> sys.stderr, 'XBRL filings pulled.'
 
-    def import_additional_schemas(self, refresh=False):
-        try:
-            assert type(self.schema_fname) == unicode
-        except AttributeError as err:
-            print >> sys.stderr, 'Schema filename not initialized. Run save_xbrl_filings first.'
-            return None
-        for event, element in etree.iterparse('%s/%s' % (self.dirname, self.schema_fname)):
-            if 'import' in element.tag:
-                url = element.attrib['schemaLocation']
-                fname = url.split('/')[-1]
-                if refresh == True or not os.path.exists('%s/%s' % (IMPORTED_SCHEMA_DIR, fname)):
-                    outmsg = 'Grabbing schema %s' % fname
-                    print >> sys.stderr, outmsg
-                    req = urllib2.Request(url, headers=HEADER)
-                    page = urllib2.urlopen(req)
-                    with open('%s/%s' % (IMPORTED_SCHEMA_DIR, fname), 'wb') as f:
-                        f.write(page.read())
-            if element.getparent() is None: break # fix for lxml bug #1185701
+    def download(self, jobs):
+        """Downloads (url, path) jobs concurrently, reporting failures"""
+        for job, path, err in self.downloader.save_all(jobs):
+            if err is None:
+                instr.count('filing_urls.files_saved')
+                print >> sys.stderr, 'Grabbed %s' % os.path.basename(path)
+            else:
+                instr.count('filing_urls.files_failed')
+                print >> sys.stderr, 'Failed to grab %s: %s' % (job[0], err)
+
+    def import_additional_schemas(self, refresh=False, schema_fnames=None):
+        if schema_fnames is None:
+            try:
+                schema_fnames = [self.schema_fname]
+            except AttributeError as err:
+                print >> sys.stderr, 'Schema filename not initialized. Run save_xbrl_filings first.'
+                return None
+        jobs = {}
+        for schema_fname in schema_fnames:
+            path = '%s/%s' % (self.dirname, schema_fname)
+            if self.archive_fname and not os.path.exists(path):
+                path = os.path.join(self.archive_fname, schema_fname)
+            if not fa.exists(path):
+                print >> sys.stderr, '%s not saved, its imports will be pulled next run' % schema_fname
+                continue
+            try:
+                for event, element in etree.iterparse(fa.open_source(path)):
+                    if 'import' in element.tag:
+                        url = element.attrib['schemaLocation']
+                        fname = url.split('/')[-1]
+                        if refresh == True or not os.path.exists('%s/%s' % (IMPORTED_SCHEMA_DIR, fname)):
+                            jobs[fname] = (url, '%s/%s' % (IMPORTED_SCHEMA_DIR, fname))
+                    if element.getparent() is None: break # fix for lxml bug #1185701
+            except etree.XMLSyntaxError as err:
+                print >> sys.stderr, 'Skipping imports of %s: %r' % (schema_fname, err)
+        self.download(jobs.values())
         print >> sys.stderr, 'Additional schemas pulled.'
 
 if __name__ == '__main__':
     description = 'Simple utility for pulling EDGAR XBRL submissions.'
 
     p = argparse.ArgumentParser(description=description)
-    p.add_argument('symbol', help="Ticker symbol")
+    p.add_argument('symbols', nargs='+', help="Ticker symbols")
     p.add_argument('--refresh', action="store_true", help="Refresh data")
+    p.add_argument('--incremental', action="store_true", 
+                   help="Only pull submissions newer than those already stored")
+    p.add_argument('--rate', type=float, default=RATE, 
+                   help="Maximum requests per second (default: %(default)s)")
+    p.add_argument('--workers', type=int, default=WORKERS, 
+                   help="Number of concurrent downloads (default: %(default)s)")
+    p.add_argument('--mirror', default=MIRROR_DIR,
+                   help=("Directory of the content-addressed mirror that saved files are "
+                         + "revalidated against (default: %(default)s)"))
+    p.add_argument('--no-mirror', action="store_true", 
+                   help="Download saved files unconditionally, without a mirror")
+    p.add_argument('--archive', action="store_true",
+                   help="Pack each CIK's filings into a compressed [CIK].zip archive")
+    p.add_argument('--ticker-map', 
+                   help=("EDGAR ticker to CIK mapping file, e.g. "
+                         + SERVER + "/files/company_tickers.json"))
     args = p.parse_args()
 
-    c = CIKFinder()
-    cik = c.get_cik(args.symbol, refresh=args.refresh)
-    f = FilingURLs(cik)
-    f.pull_xbrl_urls(refresh=args.refresh)
-    f.save_xbrl_filings(refresh=args.refresh)
-    f.import_additional_schemas(refresh=args.refresh)
+    c = CIKFinder(ticker_map_fname=args.ticker_map)
+    ciks = c.get_ciks(args.symbols, refresh=args.refresh)
+    if args.no_mirror: mirror = None
+    else: mirror = Mirror(args.mirror)
+    downloader = Downloader(HEADER, rate=args.rate, workers=args.workers, mirror=mirror)
+    for symbol in args.symbols:
+        if ciks[symbol] is None: continue
+        f = FilingURLs(ciks[symbol], downloader, archive=args.archive)
+        f.pull_xbrl_urls(refresh=args.refresh, incremental=args.incremental)
+        f.save_xbrl_filings(refresh=args.refresh)
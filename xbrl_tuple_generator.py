@@ -4,23 +4,100 @@ __author__ = "gazzman"
 __copyright__ = "(C) gazzman GNU GPL 3."
 __contributors__ = []
 
+from bisect import bisect_left
+import difflib
+import lxml.etree as etree
 import os
 import pickle
 import sys
 
+from sec import filing_archive as fa
 from sec import xbrl_reader as xr
 
 SKIP = 'or press \'s\' to skip'
 ENTERLABEL = 'Please enter the label for %s'
 LABELNOTFOUND = 'Label \'%s\' not found.'
+SUGGESTIONS = 'Similar labels: %s'
+XLINK_ROLE = '{http://www.w3.org/1999/xlink}role'
+
+
+def normalize_label(text):
+    return ' '.join(text.lower().split())
+
+
+def label_id_tag(id):
+    return ':'.join(id.split('_')[1:3])
+
+
+class LabelIndex:
+    """LabelIndex: Maps normalized label text to the tags it labels
+
+    Built once from a label linkbase, a LabelIndex maps each label's
+    lower-cased, whitespace-collapsed text to a list of (tag, role)
+    tuples, one per label element, and supports exact, prefix and
+    fuzzy lookups.
+
+    """
+
+    def __init__(self, labels):
+        self.labels = labels
+        self.keys = sorted(labels)
+
+    @classmethod
+    def from_linkbase(cls, lab):
+        labels = {}
+        for e in lab.iter(tag=etree.Element):
+            if e.text and 'id' in e.attrib:
+                entry = (label_id_tag(e.attrib['id']), e.attrib.get(XLINK_ROLE))
+                labels.setdefault(normalize_label(e.text), []).append(entry)
+        return cls(labels)
+
+    def lookup(self, label):
+        return [ tag for tag, role in self.labels.get(normalize_label(label), []) ]
+
+    def prefix(self, prefix):
+        ''' Returns the labels that start with prefix
+        '''
+        prefix = normalize_label(prefix)
+        matches = []
+        for key in self.keys[bisect_left(self.keys, prefix):]:
+            if not key.startswith(prefix): break
+            matches += [key]
+        return matches
+
+    def fuzzy(self, label, n=5, cutoff=0.8):
+        ''' Returns up to n labels that closely resemble label
+        '''
+        return difflib.get_close_matches(normalize_label(label), self.keys, n, cutoff)
+
+
+def label_index(submission):
+    ''' Returns the LabelIndex for a submission, loading it from or
+        storing it beside the label linkbase when the submission was
+        loaded from disk or an archive
+    '''
+    if 'label_index' in submission: return submission['label_index']
+    build = lambda: LabelIndex.from_linkbase(submission['lab']).labels
+    try:
+        lab_fname = xr.ftype_fname(submission.base_fname, 'lab')
+        lab_mtime = fa.getmtime(lab_fname)
+    except (AttributeError, IOError, OSError):
+        index = LabelIndex(build())
+    else:
+        index = LabelIndex(xr.cached_index(fa.sidecar_fname('%s.index' % lab_fname), lab_mtime, build))
+    submission['label_index'] = index
+    return index
+
 
 def label_tags(submission, label):
-    ids = [ e.attrib['id'] for e in submission['lab'].iter() if label_match(e.text, label) ]
-    return [ ':'.join(id.split('_')[1:3]) for id in ids ] 
+    return label_index(submission).lookup(label)
+
+
+def label_suggestions(submission, label):
+    index = label_index(submission)
+    suggestions = index.prefix(label)[:5]
+    return suggestions + [ s for s in index.fuzzy(label) if s not in suggestions ]
 
-def label_match(text, label):
-    if not text: return False
-    return text.lower() == label.lower()
 
 if __name__ == '__main__':
     ''' 
@@ -36,10 +113,9 @@ if __name__ == '__main__':
     fields_fname = sys.argv[2]
     ofext = os.path.split(fields_fname)[-1]
     if len(sys.argv) == 4: ofname = '%s_%s' % (sys.argv[3], ofext)
-    else: ofname = '%s_%s' % (base_fname, ofext)
+    else: ofname = fa.sidecar_fname('%s_%s' % (base_fname, ofext))
 
-    submission_time = base_fname.split('/')[-1].split('_')[0]
-    submission = xr.load_submission(base_fname, submission_time)
+    submission = xr.load_submission(base_fname, xr.submission_time(base_fname))
     fields = xr.listify_commented_file(fields_fname)
     header_tags = {}
     for field in fields:
@@ -50,7 +126,10 @@ if __name__ == '__main__':
             label = raw_input(pout)
             if label.lower() == 's': break
             tags = label_tags(submission, label)
-            if len(tags) == 0: print LABELNOTFOUND % label
+            if len(tags) == 0:
+                print LABELNOTFOUND % label
+                suggestions = label_suggestions(submission, label)
+                if suggestions: print SUGGESTIONS % ', '.join(suggestions)
 
         # associate tag with label
         if len(tags) == 1:
@@ -4,18 +4,23 @@ __author__ = "gazzman"
 __copyright__ = "(C) gazzman GNU GPL 3."
 __contributors__ = []
 
-from datetime import datetime
-from collections import OrderedDict
-from StringIO import StringIO
+from collections import OrderedDict, namedtuple
+import argparse
 import csv
 import pickle
 import sys
 
+import numpy as np
+
+from sec import instrumentation as instr
 from sec import xbrl_reader as xr
 
 ROWKEY = ('CIK', 'Reporting Period End Date', 'Submission Time', 'Segments',
           'Submission Period Focus', 'Period Start', 'Period End')
+RowKey = namedtuple('RowKey', ['cik', 'period_end_date', 'submission_time', 'segments',
+                               'period_focus', 'start', 'end']) # fields of ROWKEY, in order
 DATEFMT = '%Y-%m-%d'
+ONE_DAY = np.timedelta64(1, 'D')
 
 
 def add_data(rows, rowkey, header, data):
@@ -26,19 +31,31 @@ def add_data(rows, rowkey, header, data):
 
 
 def durations_covered(submission):
-    instance_namespace = xr.clean_instance_namespace(submission)
-    periods = submission['instance'].xpath('//xbrli:period', namespaces=instance_namespace)
-    durations = [ (period.xpath('./xbrli:startDate', namespaces=instance_namespace)[0].text,
-                   period.xpath('./xbrli:endDate', namespaces=instance_namespace)[0].text)
-                 for period in periods 
-                 if len(period.xpath('./xbrli:startDate', namespaces=instance_namespace)) == 1 ]
+    ''' Returns the sorted, distinct durations in the instance as a
+        pair of datetime64 arrays of starts and ends
+    '''
+    contexts = xr.index_contexts(submission)
+    durations = [ (c.start, c.end) for c in contexts.values() if c.start is not None ]
     durations = list(set(durations))
     durations.sort()
-    durations = [ (datetime.strptime(d[0], DATEFMT), 
-                   datetime.strptime(d[1], DATEFMT)) for d in durations ]
-    return durations
+    starts = np.array([ d[0] for d in durations ], dtype='datetime64[D]')
+    ends = np.array([ d[1] for d in durations ], dtype='datetime64[D]')
+    return starts, ends
+
+
+def period_boundaries(durations, instant):
+    ''' Returns the (start, end) date strings of the durations that
+        begin and those that end within a day of instant
+    '''
+    starts, ends = durations
+    instant = np.datetime64(instant, 'D')
+    bop = np.nonzero(abs(starts - instant) <= ONE_DAY)[0]
+    eop = np.nonzero(abs(ends - instant) <= ONE_DAY)[0]
+    as_strings = lambda idx: zip(starts[idx].astype(str), ends[idx].astype(str))
+    return as_strings(bop), as_strings(eop)
 
 
+@instr.timed('tuple_extract_data')
 def extract_data(submission, header_tag_tuples):
     instance_namespace = xr.clean_instance_namespace(submission)
     cik = int(xr.get_singleton_tag_value(submission, 'dei:EntityCentralIndexKey'))
@@ -50,55 +67,34 @@ def extract_data(submission, header_tag_tuples):
     except LookupError:
         submission_period_focus = None
     durations = durations_covered(submission)
+    contexts = xr.index_contexts(submission)
+    boundaries = {}
 
     rows = {}
     for header, tag in header_tag_tuples:
         namespace_key, name = tag.split(':')
-        namespace = submission['instance'].getroot().nsmap[namespace_key]
-        schema = xr.get_tag_schema('{%s}%s' % (namespace, name), submission)
-        if schema is not None:
-            period_type = schema.attrib["{%s}periodType" %instance_namespace['xbrli']]
-            for e in submission['instance'].xpath('//%s' % tag, namespaces=instance_namespace):
-                context_ref = e.attrib['contextRef']
-                context = submission['instance'].xpath("//xbrli:context[@id='%s']" % context_ref, 
-                                                       namespaces=instance_namespace)
-                assert len(context) == 1
-                context = context[0]
-
-                period = context.xpath("./xbrli:period", namespaces=instance_namespace)[0]
-                entity = context.xpath("./xbrli:entity", namespaces=instance_namespace)[0]
-
-                segments = entity.xpath('./xbrli:segment', namespaces=instance_namespace)
-                segment_info = None
-                for segment in segments:
-                    for d in segment.iterdescendants():
-                        if d.text is None: d.text = ''
-                        descendant_info = ', '.join([str(d.attrib), d.text])
-                        try:
-                            segment_info = '; '.join([segment_info, descendant_info])
-                        except TypeError:
-                            segment_info = descendant_info
+        namespace = instance_namespace[namespace_key]
+        info = xr.get_tag_info('{%s}%s' % (namespace, name), submission)
+        if info is not None:
+            period_type = info['periodType']
+            prefixed_headers = ('BoP %s' % header, 'EoP %s' % header)
+            for e in xr.tag_elements(submission, namespace, name):
+                context = contexts[e.attrib['contextRef']]
+                segment_info = context.segments
 
                 if period_type == 'instant': 
-                    instant = period.xpath("./xbrli:instant", namespaces=instance_namespace)[0].text
-                    instant = datetime.strptime(instant, DATEFMT)
-                    def apply_period_boundaries(index, prefix):
-                        ps = [ d for d in durations if abs(d[index] - instant).days <= 1 ]
-                        rowkeys = [ tuple(zip(ROWKEY, 
-                                          (cik, period_end_date, submission['time'], 
-                                           segment_info, submission_period_focus,
-                                           start.date().isoformat(), end.date().isoformat())))
-                                    for start, end in ps ]
-                        for rowkey in rowkeys:
-                            add_data(rows, rowkey, '%s %s' % (prefix, header), e.text)
-                    apply_period_boundaries(0, 'BoP')
-                    apply_period_boundaries(1, 'EoP')
+                    if context.instant not in boundaries:
+                        boundaries[context.instant] = period_boundaries(durations, context.instant)
+                    for prefixed_header, ps in zip(prefixed_headers, boundaries[context.instant]):
+                        for start, end in ps:
+                            rowkey = RowKey(cik, period_end_date, submission['time'], 
+                                            segment_info, submission_period_focus, start, end)
+                            add_data(rows, rowkey, prefixed_header, e.text)
                 elif period_type == 'duration': 
-                    start = period.xpath("./xbrli:startDate", namespaces=instance_namespace)[0].text
-                    end = period.xpath("./xbrli:endDate", namespaces=instance_namespace)[0].text
-                    rowkey = tuple(zip(ROWKEY, (cik, period_end_date, submission['time'], segment_info, 
-                                                submission_period_focus, start, end)))
+                    rowkey = RowKey(cik, period_end_date, submission['time'], segment_info, 
+                                    submission_period_focus, context.start, context.end)
                     add_data(rows, rowkey, header, e.text)
+                instr.count('facts.tuple_extract_data')
     return rows
 
 
@@ -107,33 +103,52 @@ def listify_data(rows, header_tag_tuples):
     data_headers = list(set(data_headers))
     data_headers.sort()
     headers = list(ROWKEY) + data_headers
-    rowdicts = [ dict(list(k) + rows[k].items()) for k in rows ]
+    rowdicts = [ dict(zip(ROWKEY, k) + rows[k].items()) for k in rows ]
     return headers, rowdicts
 
 
 def print_data(headers, rowdicts):
     ''' Print csv-formatted data to stdout
     '''
-    s = StringIO()
-    c = csv.DictWriter(s, headers)
-    c.writerows(rowdicts)
-    s.seek(0)
     print ','.join(headers)
-    print s.read()
+    c = csv.DictWriter(sys.stdout, headers)
+    c.writerows(rowdicts)
+    instr.count('rows.emitted', len(rowdicts))
+    print
+
+
+def aligned_mask(rowdicts):
+    ''' Returns a boolean array marking the rows whose period length is
+        within five days of 90 days per quarter of their period focus,
+        or of 365 days for a fiscal year focus
+    '''
+    days = []
+    for rowdict in rowdicts:
+        focus = rowdict['Submission Period Focus']
+        if not focus: days += [-1]
+        elif focus[-1].isdigit(): days += [90*int(focus[-1])]
+        else: days += [365]
+    days = np.array(days)
+    starts = np.array([ r['Period Start'] for r in rowdicts ], dtype='datetime64[D]')
+    ends = np.array([ r['Period End'] for r in rowdicts ], dtype='datetime64[D]')
+    period_days = (ends - starts).astype(int)
+    return (days > 0) & (abs(period_days - days) <= 5)
 
 
 def period_aligned(rowdict):
-    try:
-        quarter = int(rowdict['Submission Period Focus'][-1])
-        days = 90*quarter
-    except ValueError:
-        days = 365
-    except TypeError:
-        return False
-    start = datetime.strptime(rowdict['Period Start'], '%Y-%m-%d')
-    end = datetime.strptime(rowdict['Period End'], '%Y-%m-%d')
-    period_delta = end - start
-    return period_delta.days in range(days-5, days+6)
+    return bool(aligned_mask([rowdict])[0])
+
+
+def filter_rowdicts(rowdicts):
+    ''' Keeps the unsegmented, period-aligned rows that end on the
+        reporting period end date
+    '''
+    if len(rowdicts) == 0: return []
+    unsegmented = np.array([ not r['Segments'] for r in rowdicts ])
+    reporting_end = np.array([ r['Reporting Period End Date'] for r in rowdicts ], dtype=object)
+    period_end = np.array([ r['Period End'] for r in rowdicts ], dtype=object)
+    keep = unsegmented & aligned_mask(rowdicts) & (reporting_end == period_end)
+    return [ r for r, k in zip(rowdicts, keep) if k ]
 
 if __name__ == '__main__':
     ''' Very simple command line utility for printing XBRL instance data
@@ -146,17 +161,25 @@ if __name__ == '__main__':
                          (FIELDNAME2, NAMESPACE2:TAGNAME2), ...
                         ]
     '''
-    base_fname = sys.argv[1]
-    header_tag_tuples_fname = sys.argv[2]
-
-    header_tag_tuples = pickle.load(open(header_tag_tuples_fname, 'r'))
-    submission_time = base_fname.split('/')[-1].split('_')[0]
-    submission = xr.load_submission(base_fname, submission_time)
+    description = 'Simple utility for printing XBRL instance data by field.'
+
+    p = argparse.ArgumentParser(description=description)
+    p.add_argument('base_fname', help="Base filename of the XBRL submission")
+    p.add_argument('header_tag_tuples', help="Pickled list of (field, tag) tuples")
+    p.add_argument('--parquet', metavar='PATH', help="Write Parquet to PATH instead of csv to stdout")
+    p.add_argument('--partition', action="store_true", 
+                   help="Partition the Parquet output in PATH by CIK and period focus")
+    args = p.parse_args()
+
+    header_tag_tuples = pickle.load(open(args.header_tag_tuples, 'r'))
+    submission = xr.load_submission(args.base_fname, xr.submission_time(args.base_fname))
     rows = extract_data(submission, header_tag_tuples)
     headers, rowdicts = listify_data(rows, header_tag_tuples)
-    rowdicts = [ rowdict for rowdict in rowdicts if not rowdict['Segments'] ]
-    rowdicts = [ rowdict for rowdict in rowdicts if period_aligned(rowdict) ]
-    rowdicts = [ rowdict for rowdict in rowdicts 
-        if rowdict['Reporting Period End Date'] == rowdict['Period End']
-        ]
-    print_data(headers, rowdicts)
+    rowdicts = filter_rowdicts(rowdicts)
+    if args.parquet:
+        from sec import xbrl_parquet
+        sink = xbrl_parquet.tuple_sink(args.parquet, headers, args.partition)
+        sink.write_rows(rowdicts)
+        sink.close()
+    else:
+        print_data(headers, rowdicts)